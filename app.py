@@ -2,31 +2,60 @@
 Main Flask application for Lala Panel
 """
 import os
+import stat
+import errno
+import ctypes
+import sys
+import platform
 import hashlib
 import time
 import subprocess
 import shutil
+import tempfile
+import zipfile
 import re
+import threading
+import mimetypes
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from urllib.parse import quote
+from cachetools import TTLCache
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, make_response, send_file
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_wtf.csrf import CSRFProtect
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_talisman import Talisman
-from functools import wraps
+from jinja2 import FileSystemBytecodeCache
+from collections import deque
+from functools import wraps, lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import secrets
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import serialization
 
-from config import Config
+from config import Config, CONFIG_MAPPING
 from database import Database
 from site_manager import SiteManager, DatabaseManager, UserManager
 
 app = Flask(__name__)
-app.config.from_object(Config)
+app.config.from_mapping(CONFIG_MAPPING)
+app.config['SECRET_KEY'] = Config.secret_key()
+
+# Match routes with or without a trailing slash instead of redirecting
+app.url_map.strict_slashes = False
+
+# Keep compiled templates on disk so a restarted panel doesn't recompile them
+try:
+    os.makedirs(app.config['JINJA_CACHE_DIR'], exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_CACHE_DIR'])
+except OSError as e:
+    app.logger.warning(f"Template bytecode cache disabled: {e}")
+
+# JSON responses are only read by the panel's own scripts, so skip sorting
+# every object's keys (noticeable on large file manager listings)
+app.json.sort_keys = False
 
 # Set permanent session lifetime
 app.permanent_session_lifetime = timedelta(hours=1)
@@ -92,69 +121,300 @@ def add_security_headers(response):
     return response
 
 # Template filters
-@app.template_filter('os_info')
+
+# Host details that cannot change while the panel is running
+_OS_INFO = f"{platform.system()} {platform.release()}"
+_PY_VERSION = sys.version.split()[0]
+try:
+    import psutil
+except ImportError:
+    psutil = None
+try:
+    _BOOT_TIME = psutil.boot_time()
+except Exception:
+    _BOOT_TIME = None
+
 def os_info_filter(value):
     """Template filter to display OS information. The value parameter is required by Jinja2 but not used."""
-    import platform
-    return f"{platform.system()} {platform.release()}"
+    return _OS_INFO
 
-@app.template_filter('python_version')
 def python_version_filter(value):
     """Template filter to display Python version. The value parameter is required by Jinja2 but not used."""
-    import sys
-    return f"{sys.version.split()[0]}"
+    return _PY_VERSION
 
-@app.template_filter('uptime')
 def uptime_filter(value):
     """Template filter to display system uptime. The value parameter is required by Jinja2 but not used."""
-    try:
-        import psutil
-        boot_time = psutil.boot_time()
-        uptime_seconds = time.time() - boot_time
-        days = int(uptime_seconds // 86400)
-        hours = int((uptime_seconds % 86400) // 3600)
-        minutes = int((uptime_seconds % 3600) // 60)
-        return f"{days}d {hours}h {minutes}m"
-    except:
+    if _BOOT_TIME is None:
         return "Unknown"
+    uptime_seconds = time.time() - _BOOT_TIME
+    days = int(uptime_seconds // 86400)
+    hours = int((uptime_seconds % 86400) // 3600)
+    minutes = int((uptime_seconds % 3600) // 60)
+    return f"{days}d {hours}h {minutes}m"
+
+app.add_template_filter(os_info_filter, 'os_info')
+app.add_template_filter(python_version_filter, 'python_version')
+app.add_template_filter(uptime_filter, 'uptime')
+
+# Values every template can use without being passed them
+app.jinja_env.globals['now'] = datetime.now
+app.jinja_env.globals['php_versions'] = app.config['AVAILABLE_PHP_VERSIONS']
 
 # Template context processor
 @app.context_processor
-def inject_now():
-    """Inject current datetime into all templates"""
-    return {'now': datetime.now}
+def inject_new_credentials():
+    """Hand credentials queued by show_credentials_once() to the next rendered page"""
+    return {'new_credentials': session.pop('new_credentials', [])}
+
+# Patterns used on request paths, compiled once at import
+_FILENAME_UNSAFE_RE = re.compile(r'[^\w\s\-\.]')
+_DOMAIN_RE = re.compile(
+    r'^(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z0-9][a-z0-9-]{0,61}[a-z0-9]$'
+)
+_PHP_VALUE_RE = re.compile(r'fastcgi_param PHP_VALUE "([^"]+)"')
+# Relative paths may not be absolute, climb with '..' or carry a NUL byte;
+# single names additionally may not contain '/' or '..' anywhere
+_UNSAFE_PATH_RE = re.compile(r'\x00|^/|(?:^|/)\.\.(?:/|$)')
+_UNSAFE_NAME_RE = re.compile(r'\x00|/|\.\.')
 
 # Security helper functions
 def sanitize_filename(filename):
     """Sanitize filename to prevent directory traversal and other attacks"""
-    import re
     # Remove any path components
     filename = os.path.basename(filename)
     # Remove potentially dangerous characters
-    filename = re.sub(r'[^\w\s\-\.]', '', filename)
+    filename = _FILENAME_UNSAFE_RE.sub('', filename)
     # Prevent hidden files
     if filename.startswith('.'):
         filename = filename[1:]
     return filename
 
-def validate_path(path, base_path):
-    """Validate that path is within base_path to prevent directory traversal"""
+def is_safe_name(name):
+    """Check a single new file/folder name supplied by the user"""
+    return bool(name) and not _UNSAFE_NAME_RE.search(name)
+
+def resolve_within(base_path, rel_path):
+    """Resolve a user-supplied path relative to a site root
+    
+    Returns:
+        str: the real path, or None if rel_path is absolute, has '..'
+        components, or resolves (e.g. through a symlink) outside base_path
+    """
+    if _UNSAFE_PATH_RE.search(rel_path):
+        return None
     try:
-        # Resolve to absolute paths
-        abs_path = os.path.abspath(os.path.join(base_path, path))
-        abs_base = os.path.abspath(base_path)
-        
-        # Check if the resolved path starts with base path
-        return abs_path.startswith(abs_base)
-    except (ValueError, OSError):
-        return False
+        full_path = os.path.realpath(os.path.join(base_path, rel_path))
+    except (OSError, ValueError):
+        return None
+    return full_path if is_within(full_path, base_path) else None
+
+@lru_cache(maxsize=256)
+def site_htdocs(domain):
+    """Resolved htdocs directory of a site; cached since it never moves"""
+    return os.path.realpath(os.path.join(app.config['SITES_DIR_REAL'], domain, 'htdocs'))
+
+def is_within(path, base_path):
+    """Check that a resolved path is base_path itself or lies below it"""
+    return path == base_path or path.startswith(base_path + os.sep)
+
+# Formats that are already compressed; deflating them again costs CPU and
+# saves next to nothing, so they are stored as-is in archives
+_PRECOMPRESSED_EXTENSIONS = frozenset({
+    'jpg', 'jpeg', 'png', 'gif', 'webp', 'avif', 'mp3', 'mp4', 'm4a', 'mov',
+    'webm', 'ogg', 'zip', 'gz', 'tgz', 'bz2', 'xz', 'zst', '7z', 'rar',
+    'woff', 'woff2', 'pdf',
+})
+
+def zip_compress_type(path):
+    """Pick the zip compression method for a file by its extension"""
+    ext = os.path.splitext(path)[1][1:].lower()
+    return zipfile.ZIP_STORED if ext in _PRECOMPRESSED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+# renameat2(2) with RENAME_NOREPLACE renames only if the target doesn't
+# exist, checked atomically by the kernel; needs glibc 2.28+
+try:
+    _renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+    _renameat2.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+except (OSError, AttributeError):
+    _renameat2 = None
+_AT_FDCWD = -100
+_RENAME_NOREPLACE = 1
+
+def rename_noreplace(src, dst):
+    """Rename src to dst, raising FileExistsError if dst already exists"""
+    if _renameat2 is not None:
+        if _renameat2(_AT_FDCWD, os.fsencode(src), _AT_FDCWD, os.fsencode(dst), _RENAME_NOREPLACE) == 0:
+            return
+        err = ctypes.get_errno()
+        # ENOSYS: old kernel; EINVAL: filesystem doesn't support the flag
+        if err not in (errno.ENOSYS, errno.EINVAL):
+            raise OSError(err, os.strerror(err), src, None, dst)
+    
+    if os.path.lexists(dst):
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+    os.rename(src, dst)
+
+def stat_or_none(path):
+    """os.stat(path), or None if it doesn't exist or can't be examined"""
+    try:
+        return os.stat(path)
+    except (OSError, ValueError):
+        return None
+
+def walk_files(directory):
+    """Yield the regular files below directory
+    
+    Entry types come from scandir, so no stat is needed per entry. Symlinks
+    are skipped, which keeps links pointing outside the site out of archives.
+    Unreadable directories are skipped, as os.walk does.
+    """
+    pending = [directory]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry.path
+        except OSError:
+            continue
+
+def zip_members(full_path):
+    """Yield (path, arcname) for a file, or for every file below a directory"""
+    st = stat_or_none(full_path)
+    if st is None:
+        return
+    if stat.S_ISREG(st.st_mode):
+        yield full_path, os.path.basename(full_path)
+    elif stat.S_ISDIR(st.st_mode):
+        parent = os.path.dirname(full_path)
+        for file_path in walk_files(full_path):
+            yield file_path, os.path.relpath(file_path, parent)
+
+# Archive extraction runs off the request thread; finished jobs are kept
+# for an hour so the page can pick up the result
+_extract_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='extract')
+_extract_jobs = TTLCache(maxsize=256, ttl=3600)
+_extract_jobs_lock = threading.Lock()
+
+def run_extract_job(job_id, archive_path, targets):
+    """Extract zip members to their pre-validated target paths
+    
+    targets is a list of (ZipInfo, real target path) pairs.
+    """
+    try:
+        with zipfile.ZipFile(archive_path, 'r') as zipf:
+            for member, target in targets:
+                if member.is_dir():
+                    os.makedirs(target, exist_ok=True)
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                with zipf.open(member) as src, os.fdopen(fd, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, length=1024 * 1024)
+        result = {'status': 'done', 'error': None}
+    except Exception as e:
+        app.logger.warning(f"Extraction of {archive_path} failed: {e}")
+        result = {'status': 'failed', 'error': str(e)}
+    with _extract_jobs_lock:
+        _extract_jobs[job_id] = result
+
+class _ZipStreamSink:
+    """Unseekable write target that collects zip output for a streaming response"""
+    
+    def __init__(self):
+        self._chunks = []
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self):
+        """Return and forget everything written so far"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def stream_zip(members, chunk_size=1024 * 1024):
+    """Generate a zip archive of (path, arcname) pairs piece by piece
+    
+    zipfile writes data descriptors when its target can't seek, so each
+    member is sent as soon as it is compressed and nothing touches the disk.
+    """
+    sink = _ZipStreamSink()
+    with zipfile.ZipFile(sink, 'w') as zipf:
+        for path, arcname in members:
+            zinfo = zipfile.ZipInfo.from_file(path, arcname)
+            zinfo.compress_type = zip_compress_type(path)
+            with open(path, 'rb') as src, zipf.open(zinfo, 'w') as dest:
+                while chunk := src.read(chunk_size):
+                    dest.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    # Central directory, written when the archive is closed
+    yield sink.drain()
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
     if '.' not in filename:
         return False
     ext = filename.rsplit('.', 1)[1].lower()
-    return ext in app.config.get('ALLOWED_EXTENSIONS', set())
+    return ext in app.config.get('ALLOWED_EXTENSIONS', frozenset())
+
+def write_file_with_mode(path, data, mode):
+    """Write bytes to path, creating or truncating it with the given permissions"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    with os.fdopen(fd, 'wb') as f:
+        # O_CREAT only applies the mode to new files
+        os.fchmod(f.fileno(), mode)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+def save_upload(file, path, mode=0o644):
+    """Write an uploaded file to path, created with the given permissions
+    
+    Uploads Werkzeug has already spooled to a temporary file are copied in
+    the kernel with copy_file_range; uploads still held in memory, or files
+    the kernel can't copy between, use a 1MiB buffered copy.
+    """
+    stream = file.stream
+    # fileno() on a SpooledTemporaryFile would first write it out to disk
+    on_disk = getattr(stream, '_rolled', True) and hasattr(stream, 'fileno')
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    with os.fdopen(fd, 'wb') as out:
+        os.fchmod(out.fileno(), mode)
+        if on_disk:
+            try:
+                src_fd = stream.fileno()
+                stream.seek(0)
+                while os.copy_file_range(src_fd, out.fileno(), 64 * 1024 * 1024):
+                    pass
+                return
+            except (AttributeError, OSError):
+                # No real descriptor, or the kernel can't copy between these files
+                out.seek(0)
+                out.truncate()
+        stream.seek(0)
+        shutil.copyfileobj(stream, out, length=1024 * 1024)
+
+def show_credentials_once(title, items):
+    """Queue generated credentials for a one-time display on the next page
+    
+    Kept apart from flash messages so secrets never end up in message text.
+    items is a list of (label, value) pairs.
+    """
+    session['new_credentials'] = session.get('new_credentials', []) + [
+        {'title': title, 'items': [list(item) for item in items]}
+    ]
 
 def audit_log(action, details, user_id=None):
     """Log security-relevant actions for audit purposes"""
@@ -172,22 +432,98 @@ def audit_log(action, details, user_id=None):
     except Exception as e:
         app.logger.error(f"Failed to write audit log: {e}")
 
-# Initialize components lazily to allow testing
+# Latest system metrics snapshot, replaced wholesale by MetricsPoller so
+# system_info never measures anything itself; empty until the first poll
+_METRICS = {}
+_metrics_poller = None
+
+# Service states cost a systemctl fork, so the poller only refreshes them
+# while system_info has been viewed within this many seconds
+SERVICE_POLL_WINDOW = 60
+_metrics_viewed_at = 0.0
+
+def managed_services():
+    """systemd units shown and controlled by the panel"""
+    return ['nginx', 'mariadb', *(f'php{version}-fpm' for version in app.config['AVAILABLE_PHP_VERSIONS'])]
+
+def collect_metrics(refresh_services=True):
+    """Take one snapshot of CPU, memory, disk, load and service states
+    
+    Without refresh_services, service states are carried over from the
+    previous snapshot when it has them.
+    """
+    previous = _METRICS
+    if refresh_services or 'services' not in previous:
+        services, services_at = query_service_statuses(managed_services()), time.monotonic()
+    else:
+        services, services_at = previous['services'], previous['services_at']
+    return {
+        # Usage since the previous call; the poller primes the counter
+        'cpu_percent': psutil.cpu_percent(interval=None),
+        'cpu_count': psutil.cpu_count(),
+        'memory': psutil.virtual_memory(),
+        'disk': psutil.disk_usage('/'),
+        'load_avg': os.getloadavg() if hasattr(os, 'getloadavg') else (0, 0, 0),
+        'services': services,
+        'services_at': services_at,
+    }
+
+def refresh_service_metrics():
+    """Ask systemd for the current service states and publish them in _METRICS"""
+    global _METRICS
+    _METRICS = {**_METRICS, 'services': query_service_statuses(managed_services()),
+                'services_at': time.monotonic()}
+    return _METRICS
+
+class MetricsPoller(threading.Thread):
+    """Background thread refreshing _METRICS every interval seconds"""
+    
+    def __init__(self, interval=2):
+        super().__init__(name='metrics-poller', daemon=True)
+        self.interval = interval
+    
+    def run(self):
+        global _METRICS
+        psutil.cpu_percent(interval=None)
+        while True:
+            time.sleep(self.interval)
+            try:
+                viewed_recently = time.monotonic() - _metrics_viewed_at < SERVICE_POLL_WINDOW
+                _METRICS = collect_metrics(refresh_services=viewed_recently)
+            except Exception as e:
+                app.logger.error(f"Failed to collect system metrics: {e}")
+
+def start_metrics_poller():
+    """Start the metrics poller once, if psutil is available"""
+    global _metrics_poller
+    if psutil is None or _metrics_poller is not None:
+        return
+    _metrics_poller = MetricsPoller()
+    _metrics_poller.start()
+
+# Application components, created once at import time
 db = None
 site_manager = None
 db_manager = None
 user_manager = None
+_init_lock = threading.Lock()
 
 def init_components():
     """Initialize application components"""
     global db, site_manager, db_manager, user_manager
-    if db is None:
-        db = Database(app.config['DATABASE_PATH'])
-        site_manager = SiteManager(app.config, db)
-        db_manager = DatabaseManager(app.config)
-        user_manager = UserManager(app.config)
+    with _init_lock:
+        if db is None:
+            db = Database(app.config['DATABASE_PATH'])
+            site_manager = SiteManager(app.config, db)
+            db_manager = DatabaseManager(app.config)
+            user_manager = UserManager(app.config)
+            start_metrics_poller()
     return db, site_manager, db_manager, user_manager
 
+# Under LALAPANEL_TESTING, tests adjust app.config and call init_components() themselves
+if not app.config.get('TESTING'):
+    init_components()
+
 # Flask-Login setup
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -200,37 +536,95 @@ class User(UserMixin):
 
 @login_manager.user_loader
 def load_user(user_id):
-    init_components()
-    with db.get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE id = ?', (int(user_id),))
-        user_data = cursor.fetchone()
+    with db.read_connection() as conn:
+        user_data = conn.execute(
+            'SELECT id, username FROM users WHERE id = ?', (int(user_id),)
+        ).fetchone()
     if user_data:
         return User(user_data['id'], user_data['username'])
     return None
 
-# Rate limiting decorator
+# Times of recent login attempts per IP, kept in memory for the 15 minute
+# sliding rate-limit window
+LOGIN_WINDOW = 900
+_login_hits = {}
+_login_hits_lock = threading.Lock()
+
 def check_rate_limit(ip_address, max_attempts=5):
-    """Check if IP has exceeded login attempts"""
-    attempts = db.get_recent_login_attempts(ip_address, minutes=15)
-    return attempts < max_attempts
+    """Record a login attempt and check if IP has exceeded login attempts
+    
+    Refused attempts are not recorded, so a lockout always ends once the
+    oldest counted attempt leaves the window.
+    """
+    now = time.monotonic()
+    cutoff = now - LOGIN_WINDOW
+    with _login_hits_lock:
+        hits = _login_hits.get(ip_address)
+        if hits is None:
+            # Forget idle addresses now and then so the dict stays bounded
+            if len(_login_hits) >= 10000:
+                for ip in [ip for ip, times in _login_hits.items() if not times or times[-1] <= cutoff]:
+                    del _login_hits[ip]
+            hits = _login_hits[ip_address] = deque()
+        while hits and hits[0] <= cutoff:
+            hits.popleft()
+        if len(hits) >= max_attempts:
+            return False
+        hits.append(now)
+    return True
+
+# Recently verified credentials, so repeat logins skip the password hash.
+# Keyed on the stored hash, so a password changed anywhere (setup.py runs in
+# its own process) takes effect at once. Failures are never cached, so every
+# bad attempt still pays the full cost.
+_auth_cache = TTLCache(maxsize=1024, ttl=60)
+_auth_cache_lock = threading.Lock()
+
+# Checked against when the username is unknown so that a failed login takes
+# as long whether or not the account exists
+_DUMMY_HASH = generate_password_hash(secrets.token_hex(16))
+
+def verify_credentials(username, password):
+    """Return (user_id, username) if the credentials are valid, otherwise None"""
+    user_data = db.get_user(username)
+    if user_data is None:
+        check_password_hash(_DUMMY_HASH, password)
+        return None
+    
+    cache_key = hashlib.sha256(f"{user_data['password_hash']}\0{password}".encode()).digest()
+    with _auth_cache_lock:
+        cached = _auth_cache.get(cache_key)
+    if cached:
+        return cached
+    
+    if check_password_hash(user_data['password_hash'], password):
+        cached = (user_data['id'], user_data['username'])
+        with _auth_cache_lock:
+            _auth_cache[cache_key] = cached
+        return cached
+    return None
+
+# Distinguishes ETags issued by this process from those of earlier runs
+_BOOT_ID = secrets.token_hex(4)
+
+# Fixed URLs of the most frequent redirect targets, so they skip url_for
+DASHBOARD_URL = '/dashboard'
+LOGIN_URL = '/login'
 
 # Routes
 @app.route('/')
 def index():
     """Redirect to dashboard or login"""
-    init_components()
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
-    return redirect(url_for('login'))
+        return redirect(DASHBOARD_URL)
+    return redirect(LOGIN_URL)
 
-@app.route('/login', methods=['GET', 'POST'])
+@app.route(LOGIN_URL, methods=['GET', 'POST'])
 @limiter.limit("10 per minute")
 def login():
     """Login page"""
-    init_components()
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(DASHBOARD_URL)
     
     if request.method == 'POST':
         username = request.form.get('username', '').strip()
@@ -242,18 +636,15 @@ def login():
             flash('Username and password are required', 'error')
             return render_template('login.html')
         
-        # Check rate limit
+        # Check rate limit (also records this attempt)
         if not check_rate_limit(ip_address):
             flash('Too many login attempts. Please try again later.', 'error')
             return render_template('login.html')
         
-        # Record login attempt
-        db.record_login_attempt(ip_address)
-        
         # Verify credentials
-        user_data = db.get_user(username)
-        if user_data and check_password_hash(user_data['password_hash'], password):
-            user = User(user_data['id'], user_data['username'])
+        verified = verify_credentials(username, password)
+        if verified:
+            user = User(*verified)
             login_user(user)
             
             # Set session as permanent to use the configured session timeout
@@ -263,7 +654,7 @@ def login():
             # Validate next_page to prevent open redirect
             if next_page and next_page.startswith('/'):
                 return redirect(next_page)
-            return redirect(url_for('dashboard'))
+            return redirect(DASHBOARD_URL)
         else:
             flash('Invalid username or password', 'error')
     
@@ -274,22 +665,35 @@ def login():
 def logout():
     """Logout"""
     logout_user()
-    return redirect(url_for('login'))
+    return redirect(LOGIN_URL)
 
-@app.route('/dashboard')
+@app.route(DASHBOARD_URL)
 @login_required
 def dashboard():
     """Dashboard showing all sites"""
-    init_components()
-    sites = db.get_all_sites()
-    return render_template('dashboard.html', sites=sites)
+    # Sites only change through this process, so the sites version identifies
+    # the list; the CSRF token keeps cached pages in step with the session
+    etag = hashlib.sha256(
+        f"{current_user.id}:{session.get('csrf_token', '')}:{_BOOT_ID}:{db.sites_version}".encode()
+    ).hexdigest()[:16]
+    
+    # Pending messages must be rendered, so never answer 304 with them queued
+    if (request.if_none_match.contains(etag)
+            and '_flashes' not in session and 'new_credentials' not in session):
+        response = app.response_class(status=304)
+    else:
+        sites = db.get_all_sites()
+        response = make_response(render_template('dashboard.html', sites=sites))
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @app.route('/sites/create', methods=['GET', 'POST'])
 @login_required
 @limiter.limit("20 per hour")
 def create_site():
     """Create a new site"""
-    init_components()
     if request.method == 'POST':
         domain = request.form.get('domain', '').strip().lower()
         php_version = request.form.get('php_version')
@@ -297,20 +701,14 @@ def create_site():
         create_db = request.form.get('create_database') == 'on'
         
         # Validate domain name
-        import re
-        domain_pattern = re.compile(
-            r'^(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z0-9][a-z0-9-]{0,61}[a-z0-9]$'
-        )
-        if not domain or not domain_pattern.match(domain):
+        if not domain or not _DOMAIN_RE.match(domain):
             flash('Invalid domain name. Please use a valid domain format (e.g., example.com)', 'error')
-            return render_template('create_site.html', 
-                                 php_versions=app.config['AVAILABLE_PHP_VERSIONS'])
+            return render_template('create_site.html')
         
         # Validate PHP version
         if php_version not in app.config['AVAILABLE_PHP_VERSIONS']:
             flash('Invalid PHP version selected', 'error')
-            return render_template('create_site.html', 
-                                 php_versions=app.config['AVAILABLE_PHP_VERSIONS'])
+            return render_template('create_site.html')
         
         # Get PHP settings
         php_settings = {
@@ -324,8 +722,7 @@ def create_site():
             # Check if site already exists
             if db.get_site_by_domain(domain):
                 flash(f'Site {domain} already exists', 'error')
-                return render_template('create_site.html', 
-                                     php_versions=app.config['AVAILABLE_PHP_VERSIONS'])
+                return render_template('create_site.html')
             
             audit_log('SITE_CREATE', f'Creating site: {domain}')
             
@@ -335,17 +732,20 @@ def create_site():
             # Create nginx config (without SSL initially)
             site_manager.create_nginx_config(domain, php_version, ssl_enabled=False, php_settings=php_settings)
             
-            # Enable site
-            site_manager.enable_site(domain)
+            # Enable site; the reload is only needed right away when certbot
+            # must reach the new vhost for its HTTP challenge
+            needs_ssl_request = ssl_mode in ('auto', 'domain_only')
+            site_manager.enable_site(domain, defer_reload=not needs_ssl_request)
             
             # Handle SSL based on mode
             ssl_enabled = False
             if ssl_mode == 'auto':
                 try:
                     site_manager.request_ssl_certificate(domain, include_www=True)
-                    # Recreate nginx config with SSL
-                    site_manager.create_nginx_config(domain, php_version, ssl_enabled=True, php_settings=php_settings)
-                    site_manager.enable_site(domain)
+                    # Recreate nginx config with SSL (PHP-FPM was checked by the first render)
+                    site_manager.create_nginx_config(domain, php_version, ssl_enabled=True,
+                                                     php_settings=php_settings, check_php_fpm=False)
+                    site_manager.enable_site(domain, defer_reload=True)
                     ssl_enabled = True
                     audit_log('SSL_AUTO', f'SSL auto-configured for {domain}')
                     flash(f'SSL certificate obtained successfully for {domain} and www.{domain}', 'success')
@@ -354,9 +754,10 @@ def create_site():
             elif ssl_mode == 'domain_only':
                 try:
                     site_manager.request_ssl_certificate(domain, include_www=False)
-                    # Recreate nginx config with SSL
-                    site_manager.create_nginx_config(domain, php_version, ssl_enabled=True, php_settings=php_settings)
-                    site_manager.enable_site(domain)
+                    # Recreate nginx config with SSL (PHP-FPM was checked by the first render)
+                    site_manager.create_nginx_config(domain, php_version, ssl_enabled=True,
+                                                     php_settings=php_settings, check_php_fpm=False)
+                    site_manager.enable_site(domain, defer_reload=True)
                     ssl_enabled = True
                     audit_log('SSL_AUTO', f'SSL auto-configured for {domain} (domain only)')
                     flash(f'SSL certificate obtained successfully for {domain} (without www)', 'success')
@@ -372,7 +773,7 @@ def create_site():
             if create_db:
                 # Generate unique database name with hash to avoid conflicts
                 domain_base = domain.replace('.', '_').replace('-', '_')
-                hash_suffix = hashlib.md5(f"{domain}{time.time()}".encode()).hexdigest()[:6]
+                hash_suffix = secrets.token_hex(3)
                 db_name = f"{domain_base}_{hash_suffix}"[:64]  # MySQL max identifier length
                 db_user = f"user_{hash_suffix}"
                 db_password = db_manager.generate_password()
@@ -381,7 +782,10 @@ def create_site():
                     db_manager.create_database(db_name, db_user, db_password)
                     db.create_database(site_id, db_name, db_user, db_password)
                     audit_log('DATABASE_CREATE', f'Database created: {db_name}')
-                    flash(f'Database created: {db_name} (User: {db_user}, Password: {db_password})', 'success')
+                    flash(f'Database created: {db_name}', 'success')
+                    show_credentials_once(f'Database {db_name}', [
+                        ('Database', db_name), ('User', db_user), ('Password', db_password)
+                    ])
                 except Exception as e:
                     flash(f'Warning: Database creation failed: {str(e)}', 'warning')
             
@@ -395,7 +799,7 @@ def create_site():
                 # Auto-generate username if not provided
                 if not ftp_username:
                     domain_base = domain.replace('.', '').replace('-', '')[:10]
-                    hash_suffix = hashlib.md5(f"{domain}{time.time()}".encode()).hexdigest()[:4]
+                    hash_suffix = secrets.token_hex(2)
                     ftp_username = f"ftp_{domain_base}_{hash_suffix}"[:32]
                 
                 # Auto-generate password if not provided
@@ -406,7 +810,10 @@ def create_site():
                     user_manager.create_ftp_user(ftp_username, ftp_password, domain, access_type)
                     db.create_ftp_user(site_id, ftp_username, access_type)
                     audit_log('USER_CREATE', f'SSH/FTP user created: {ftp_username}')
-                    flash(f'SSH/FTP User created: {ftp_username} (Password: {ftp_password})', 'success')
+                    flash(f'SSH/FTP User created: {ftp_username}', 'success')
+                    show_credentials_once(f'SSH/FTP user {ftp_username}', [
+                        ('Username', ftp_username), ('Password', ftp_password)
+                    ])
                 except Exception as e:
                     flash(f'Warning: SSH/FTP user creation failed: {str(e)}', 'warning')
             
@@ -416,33 +823,27 @@ def create_site():
         except Exception as e:
             audit_log('SITE_CREATE_FAILED', f'Failed to create site {domain}: {str(e)}')
             flash(f'Error creating site: {str(e)}', 'error')
-            return render_template('create_site.html', 
-                                 php_versions=app.config['AVAILABLE_PHP_VERSIONS'])
+            return render_template('create_site.html')
     
-    return render_template('create_site.html', 
-                         php_versions=app.config['AVAILABLE_PHP_VERSIONS'])
+    return render_template('create_site.html')
 
 @app.route('/sites/<int:site_id>')
 @login_required
 def site_detail(site_id):
     """Site detail and management"""
-    init_components()
-    site = db.get_site(site_id)
+    site, databases = db.get_site_with_databases(site_id)
     if not site:
         flash('Site not found', 'error')
         return redirect(url_for('dashboard'))
     
-    databases = db.get_databases_for_site(site_id)
     return render_template('site_detail.html', 
                          site=site, 
-                         databases=databases,
-                         php_versions=app.config['AVAILABLE_PHP_VERSIONS'])
+                         databases=databases)
 
 @app.route('/sites/<int:site_id>/update-php', methods=['POST'])
 @login_required
 def update_site_php(site_id):
     """Update PHP version for a site"""
-    init_components()
     site = db.get_site(site_id)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
@@ -463,7 +864,6 @@ def update_site_php(site_id):
 @limiter.limit("5 per hour")
 def request_ssl(site_id):
     """Request SSL certificate for a site"""
-    init_components()
     site = db.get_site(site_id)
     if not site:
         flash('Site not found', 'error')
@@ -480,7 +880,7 @@ def request_ssl(site_id):
         
         # Update nginx config with SSL
         site_manager.create_nginx_config(site['domain'], site['php_version'], ssl_enabled=True)
-        site_manager.enable_site(site['domain'])
+        site_manager.enable_site(site['domain'], defer_reload=True)
         
         # Update database
         db.update_site(site_id, ssl_enabled=True)
@@ -498,18 +898,18 @@ def request_ssl(site_id):
 @limiter.limit("5 per hour")
 def upload_ssl(site_id):
     """Upload manual SSL certificates"""
-    init_components()
     site = db.get_site(site_id)
     if not site:
         flash('Site not found', 'error')
         return redirect(url_for('dashboard'))
     
+    detail_url = url_for('site_detail', site_id=site_id)
     cert_file = request.files.get('cert_file')
     key_file = request.files.get('key_file')
     
     if not cert_file or not key_file:
         flash('Both certificate and key files are required', 'error')
-        return redirect(url_for('site_detail', site_id=site_id))
+        return redirect(detail_url)
     
     try:
         # Read the files
@@ -521,7 +921,7 @@ def upload_ssl(site_id):
             cert = x509.load_pem_x509_certificate(cert_data, default_backend())
         except Exception as e:
             flash('Invalid certificate file', 'error')
-            return redirect(url_for('site_detail', site_id=site_id))
+            return redirect(detail_url)
         
         # Validate private key
         try:
@@ -532,7 +932,7 @@ def upload_ssl(site_id):
             )
         except Exception as e:
             flash('Invalid private key file', 'error')
-            return redirect(url_for('site_detail', site_id=site_id))
+            return redirect(detail_url)
         
         # Create SSL directory for manual certs with restrictive permissions
         ssl_dir = f"/etc/letsencrypt/live/{site['domain']}"
@@ -542,18 +942,14 @@ def upload_ssl(site_id):
         cert_path = os.path.join(ssl_dir, 'fullchain.pem')
         key_path = os.path.join(ssl_dir, 'privkey.pem')
         
-        with open(cert_path, 'wb') as f:
-            f.write(cert_data)
-        with open(key_path, 'wb') as f:
-            f.write(key_data)
-        
-        # Set proper permissions
-        os.chmod(cert_path, 0o644)
-        os.chmod(key_path, 0o600)
+        # Permissions are applied before any data is written, so the private
+        # key is never readable by other users, even briefly
+        write_file_with_mode(cert_path, cert_data, 0o644)
+        write_file_with_mode(key_path, key_data, 0o600)
         
         # Update nginx config with SSL
         site_manager.create_nginx_config(site['domain'], site['php_version'], ssl_enabled=True)
-        site_manager.enable_site(site['domain'])
+        site_manager.enable_site(site['domain'], defer_reload=True)
         
         # Update database
         db.update_site(site_id, ssl_enabled=True)
@@ -564,14 +960,13 @@ def upload_ssl(site_id):
         audit_log('SSL_UPLOAD_FAILED', f'Failed to upload SSL for {site["domain"]}: {str(e)}')
         flash(f'Error uploading SSL certificates: {str(e)}', 'error')
     
-    return redirect(url_for('site_detail', site_id=site_id))
+    return redirect(detail_url)
 
 @app.route('/sites/<int:site_id>/delete', methods=['POST'])
 @login_required
 @limiter.limit("10 per hour")
 def delete_site(site_id):
     """Delete a site"""
-    init_components()
     site = db.get_site(site_id)
     if not site:
         flash('Site not found', 'error')
@@ -585,21 +980,24 @@ def delete_site(site_id):
         databases = db.get_databases_for_site(site_id)
         
         # Disable site
-        site_manager.disable_site(site['domain'])
+        site_manager.disable_site(site['domain'], defer_reload=True)
         
-        # Delete databases
-        for database in databases:
-            try:
-                db_manager.delete_database(database['db_name'], database['db_user'])
-                audit_log('DATABASE_DELETE', f'Deleted database: {database["db_name"]}')
-            except:
-                pass  # Continue even if database deletion fails
+        # Delete databases in one MariaDB session
+        try:
+            dropped = db_manager.delete_databases(
+                [(database['db_name'], database['db_user']) for database in databases]
+            )
+        except Exception:
+            dropped = []  # Continue even if database deletion fails
+        for db_name in dropped:
+            audit_log('DATABASE_DELETE', f'Deleted database: {db_name}')
         
         # Delete site files
         site_manager.delete_site_files(site['domain'])
         
         # Delete from database
         db.delete_site(site_id)
+        site_htdocs.cache_clear()
         
         flash(f'Site {site["domain"]} deleted successfully', 'success')
     except Exception as e:
@@ -612,7 +1010,6 @@ def delete_site(site_id):
 @login_required
 def edit_vhost(site_id):
     """Edit nginx vhost configuration"""
-    init_components()
     site = db.get_site(site_id)
     if not site:
         flash('Site not found', 'error')
@@ -636,7 +1033,6 @@ def edit_vhost(site_id):
 @login_required
 def save_vhost(site_id):
     """Save nginx vhost configuration"""
-    init_components()
     site = db.get_site(site_id)
     if not site:
         flash('Site not found', 'error')
@@ -660,9 +1056,9 @@ def save_vhost(site_id):
         if result.returncode != 0:
             flash(f'Configuration saved but nginx test failed: {result.stderr}', 'warning')
         else:
-            # Reload nginx
-            subprocess.run(['/usr/bin/systemctl', 'reload', 'nginx'], check=False)
-            flash('Nginx configuration updated successfully', 'success')
+            # Reload in the background; rapid saves share a single reload
+            site_manager.schedule_nginx_reload()
+            flash('Nginx configuration saved; reload queued', 'success')
         
     except Exception as e:
         flash(f'Error saving configuration: {str(e)}', 'error')
@@ -673,56 +1069,52 @@ def save_vhost(site_id):
 @login_required
 def test_nginx_config(site_id):
     """Test nginx configuration"""
-    init_components()
     site = db.get_site(site_id)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
     config_content = request.form.get('config_content', '')
-    config_path = os.path.join(app.config['NGINX_SITES_AVAILABLE'], site['domain'])
     
-    # Save to temporary file
-    temp_path = config_path + '.tmp'
+    # Test the candidate on its own, wrapped in a minimal main config, so the
+    # live vhost is never touched. The wrapper lives in the nginx directory so
+    # relative includes such as fastcgi_params resolve as they do normally.
+    nginx_dir = os.path.dirname(app.config['NGINX_SITES_AVAILABLE'].rstrip('/'))
+    candidate_path = None
+    main_path = None
     try:
-        with open(temp_path, 'w') as f:
+        fd, candidate_path = tempfile.mkstemp(prefix='.lalapanel-test-', dir=nginx_dir)
+        with os.fdopen(fd, 'w') as f:
             f.write(config_content)
         
-        # Backup original
-        backup_path = config_path + '.backup'
-        shutil.copy2(config_path, backup_path)
-        
-        # Replace with new config
-        shutil.move(temp_path, config_path)
+        fd, main_path = tempfile.mkstemp(prefix='.lalapanel-test-', suffix='.conf', dir=nginx_dir)
+        with os.fdopen(fd, 'w') as f:
+            f.write(f"events {{}}\nhttp {{\n    include {candidate_path};\n}}\n")
         
         # Test
         result = subprocess.run(
-            ['/usr/sbin/nginx', '-t'],
+            ['/usr/sbin/nginx', '-t', '-c', main_path],
             capture_output=True,
             text=True
         )
         
-        # Restore original
-        shutil.move(backup_path, config_path)
-        
         if result.returncode == 0:
             return jsonify({'success': True, 'output': result.stderr})
         else:
             return jsonify({'success': False, 'error': result.stderr})
     
     except Exception as e:
-        # Clean up
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-        if os.path.exists(backup_path):
-            shutil.move(backup_path, config_path)
-        
         return jsonify({'success': False, 'error': str(e)})
+    
+    finally:
+        # Clean up
+        for path in (candidate_path, main_path):
+            if path and os.path.exists(path):
+                os.remove(path)
 
 @app.route('/sites/<int:site_id>/php-ini')
 @login_required
 def edit_php_ini(site_id):
     """Edit PHP settings for a site"""
-    init_components()
     site = db.get_site(site_id)
     if not site:
         flash('Site not found', 'error')
@@ -744,8 +1136,7 @@ def edit_php_ini(site_id):
             config_content = f.read()
             
         # Extract PHP_VALUE settings
-        import re
-        php_value_match = re.search(r'fastcgi_param PHP_VALUE "([^"]+)"', config_content)
+        php_value_match = _PHP_VALUE_RE.search(config_content)
         if php_value_match:
             php_value_str = php_value_match.group(1)
             for setting in php_value_str.split('\\n'):
@@ -766,7 +1157,6 @@ def edit_php_ini(site_id):
 @login_required
 def save_php_ini(site_id):
     """Save PHP settings for a site"""
-    init_components()
     site = db.get_site(site_id)
     if not site:
         flash('Site not found', 'error')
@@ -792,7 +1182,7 @@ def save_php_ini(site_id):
         )
         
         # Enable site
-        site_manager.enable_site(site['domain'])
+        site_manager.enable_site(site['domain'], defer_reload=True)
         
         flash('PHP settings updated successfully', 'success')
     except Exception as e:
@@ -804,7 +1194,6 @@ def save_php_ini(site_id):
 @login_required
 def databases():
     """Database management page"""
-    init_components()
     all_databases = db.get_all_databases()
     sites = db.get_all_sites()
     return render_template('databases.html', databases=all_databases, sites=sites)
@@ -813,15 +1202,14 @@ def databases():
 @login_required
 def create_database():
     """Create a new database"""
-    init_components()
-    site_id = request.form.get('site_id')
+    site_id = request.form.get('site_id', type=int)
     db_name = request.form.get('db_name')
     
     if not site_id or not db_name:
         flash('Site and database name are required', 'error')
         return redirect(url_for('databases'))
     
-    site = db.get_site(int(site_id))
+    site = db.get_site(site_id)
     if not site:
         flash('Site not found', 'error')
         return redirect(url_for('databases'))
@@ -831,9 +1219,12 @@ def create_database():
         db_password = db_manager.generate_password()
         
         db_manager.create_database(db_name, db_user, db_password)
-        db.create_database(int(site_id), db_name, db_user, db_password)
+        db.create_database(site_id, db_name, db_user, db_password)
         
-        flash(f'Database created: {db_name} (User: {db_user}, Password: {db_password})', 'success')
+        flash(f'Database created: {db_name}', 'success')
+        show_credentials_once(f'Database {db_name}', [
+            ('Database', db_name), ('User', db_user), ('Password', db_password)
+        ])
     except Exception as e:
         flash(f'Error creating database: {str(e)}', 'error')
     
@@ -843,12 +1234,10 @@ def create_database():
 @login_required
 def delete_database(db_id):
     """Delete a database"""
-    init_components()
-    database = None
-    with db.get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM databases WHERE id = ?', (db_id,))
-        database = cursor.fetchone()
+    with db.read_connection() as conn:
+        database = conn.execute(
+            'SELECT db_name, db_user FROM databases WHERE id = ?', (db_id,)
+        ).fetchone()
     
     if not database:
         flash('Database not found', 'error')
@@ -867,7 +1256,6 @@ def delete_database(db_id):
 @login_required
 def users():
     """SSH/FTP user management page"""
-    init_components()
     all_users = db.get_all_ftp_users()
     sites = db.get_all_sites()
     return render_template('users.html', ftp_users=all_users, sites=sites)
@@ -876,8 +1264,7 @@ def users():
 @login_required
 def create_ftp_user():
     """Create a new SSH/FTP user"""
-    init_components()
-    site_id = request.form.get('site_id')
+    site_id = request.form.get('site_id', type=int)
     username = request.form.get('username')
     password = request.form.get('password')
     access_type = request.form.get('access_type', 'ftp')
@@ -886,7 +1273,7 @@ def create_ftp_user():
         flash('All fields are required', 'error')
         return redirect(url_for('users'))
     
-    site = db.get_site(int(site_id))
+    site = db.get_site(site_id)
     if not site:
         flash('Site not found', 'error')
         return redirect(url_for('users'))
@@ -896,7 +1283,7 @@ def create_ftp_user():
         user_manager.create_ftp_user(username, password, site['domain'], access_type)
         
         # Create database record
-        db.create_ftp_user(int(site_id), username, access_type)
+        db.create_ftp_user(site_id, username, access_type)
         
         flash(f'User {username} created successfully', 'success')
     except Exception as e:
@@ -908,12 +1295,10 @@ def create_ftp_user():
 @login_required
 def delete_ftp_user(user_id):
     """Delete a SSH/FTP user"""
-    init_components()
-    user = None
-    with db.get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM ftp_users WHERE id = ?', (user_id,))
-        user = cursor.fetchone()
+    with db.read_connection() as conn:
+        user = conn.execute(
+            'SELECT username FROM ftp_users WHERE id = ?', (user_id,)
+        ).fetchone()
     
     if not user:
         flash('User not found', 'error')
@@ -936,7 +1321,6 @@ def delete_ftp_user(user_id):
 @login_required
 def file_manager():
     """File manager page"""
-    init_components()
     sites = db.get_all_sites()
     return render_template('file_manager.html', sites=sites)
 
@@ -944,7 +1328,6 @@ def file_manager():
 @login_required
 def browse_files(site_id):
     """Browse files for a site"""
-    init_components()
     site = db.get_site(site_id)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
@@ -952,42 +1335,36 @@ def browse_files(site_id):
     # Get path from query parameter (relative to site htdocs)
     rel_path = request.args.get('path', '')
     
-    # Security check: prevent directory traversal
-    if '..' in rel_path or rel_path.startswith('/'):
-        return jsonify({'error': 'Invalid path'}), 400
-    
-    # Build full path
-    base_path = os.path.join(app.config['SITES_DIR'], site['domain'], 'htdocs')
-    full_path = os.path.join(base_path, rel_path) if rel_path else base_path
-    
-    # Ensure we're still within the site directory
-    try:
-        full_path = os.path.realpath(full_path)
-        base_path = os.path.realpath(base_path)
-        if not full_path.startswith(base_path):
-            return jsonify({'error': 'Access denied'}), 403
-    except:
+    # Resolve within the site directory; symlinks can't lead outside it
+    full_path = resolve_within(site_htdocs(site['domain']), rel_path)
+    if full_path is None:
         return jsonify({'error': 'Invalid path'}), 400
     
-    if not os.path.exists(full_path):
+    st = stat_or_none(full_path)
+    if st is None:
         return jsonify({'error': 'Path not found'}), 404
     
-    if not os.path.isdir(full_path):
+    if not stat.S_ISDIR(st.st_mode):
         return jsonify({'error': 'Not a directory'}), 400
     
     # List directory contents
     items = []
     try:
-        for item in sorted(os.listdir(full_path)):
-            item_path = os.path.join(full_path, item)
-            rel_item_path = os.path.join(rel_path, item) if rel_path else item
+        # scandir gets the entry type from the directory listing itself, so
+        # only the stat for size/mtime costs a syscall per entry
+        with os.scandir(full_path) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+        
+        for entry in entries:
+            rel_item_path = os.path.join(rel_path, entry.name) if rel_path else entry.name
             
-            stat_info = os.stat(item_path)
+            is_dir = entry.is_dir()
+            stat_info = entry.stat()
             items.append({
-                'name': item,
+                'name': entry.name,
                 'path': rel_item_path,
-                'is_dir': os.path.isdir(item_path),
-                'size': stat_info.st_size if not os.path.isdir(item_path) else 0,
+                'is_dir': is_dir,
+                'size': stat_info.st_size if not is_dir else 0,
                 'modified': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stat_info.st_mtime))
             })
     except PermissionError:
@@ -1003,7 +1380,6 @@ def browse_files(site_id):
 @login_required
 def download_file(site_id):
     """Download a file from a site"""
-    init_components()
     site = db.get_site(site_id)
     if not site:
         flash('Site not found', 'error')
@@ -1012,39 +1388,43 @@ def download_file(site_id):
     # Get path from query parameter
     rel_path = request.args.get('path', '')
     
-    # Security check
-    if '..' in rel_path or rel_path.startswith('/') or not rel_path:
-        flash('Invalid path', 'error')
-        return redirect(url_for('file_manager'))
-    
-    # Build full path
-    base_path = os.path.join(app.config['SITES_DIR'], site['domain'], 'htdocs')
-    full_path = os.path.join(base_path, rel_path)
-    
-    # Ensure we're still within the site directory
-    try:
-        full_path = os.path.realpath(full_path)
-        base_path = os.path.realpath(base_path)
-        if not full_path.startswith(base_path):
-            flash('Access denied', 'error')
-            return redirect(url_for('file_manager'))
-    except:
+    # Resolve within the site directory; symlinks can't lead outside it
+    full_path = resolve_within(site_htdocs(site['domain']), rel_path) if rel_path else None
+    if full_path is None:
         flash('Invalid path', 'error')
         return redirect(url_for('file_manager'))
     
-    if not os.path.exists(full_path) or not os.path.isfile(full_path):
+    st = stat_or_none(full_path)
+    if st is None or not stat.S_ISREG(st.st_mode):
         flash('File not found', 'error')
         return redirect(url_for('file_manager'))
     
-    from flask import send_file
-    return send_file(full_path, as_attachment=True, download_name=os.path.basename(full_path))
+    filename = os.path.basename(full_path)
+    
+    # Behind the panel's nginx vhost, let nginx stream the file itself
+    if request.headers.get('X-Sendfile-Type') == 'X-Accel-Redirect':
+        internal_path = '/_protected_files/' + os.path.relpath(full_path, app.config['SITES_DIR_REAL'])
+        try:
+            filename.encode('ascii')
+            disposition = {'filename': filename}
+        except UnicodeEncodeError:
+            disposition = {
+                'filename': filename.encode('ascii', 'ignore').decode() or 'download',
+                'filename*': f"UTF-8''{quote(filename)}",
+            }
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = quote(internal_path)
+        response.headers['Content-Type'] = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response.headers.set('Content-Disposition', 'attachment', **disposition)
+        return response
+    
+    return send_file(full_path, as_attachment=True, download_name=filename)
 
 @app.route('/files/upload/<int:site_id>', methods=['POST'])
 @login_required
 @limiter.limit("50 per hour")
 def upload_file(site_id):
     """Upload a file to a site"""
-    init_components()
     site = db.get_site(site_id)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
@@ -1052,11 +1432,6 @@ def upload_file(site_id):
     # Get path from form
     rel_path = request.form.get('path', '')
     
-    # Security check
-    if '..' in rel_path or rel_path.startswith('/'):
-        audit_log('FILE_UPLOAD_FAILED', f'Invalid path attempt: {rel_path}')
-        return jsonify({'error': 'Invalid path'}), 400
-    
     # Get uploaded file
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
@@ -1072,26 +1447,14 @@ def upload_file(site_id):
     if not safe_filename:
         return jsonify({'error': 'Invalid filename'}), 400
     
-    # Build full path
-    base_path = os.path.join(app.config['SITES_DIR'], site['domain'], 'htdocs')
-    upload_dir = os.path.join(base_path, rel_path) if rel_path else base_path
-    
-    # Validate path is within base
-    if not validate_path(upload_dir, base_path):
-        audit_log('FILE_UPLOAD_FAILED', f'Path traversal attempt: {upload_dir}')
-        return jsonify({'error': 'Access denied'}), 403
-    
-    # Ensure we're still within the site directory
-    try:
-        upload_dir = os.path.realpath(upload_dir)
-        base_path = os.path.realpath(base_path)
-        if not upload_dir.startswith(base_path):
-            audit_log('FILE_UPLOAD_FAILED', f'Directory traversal attempt: {upload_dir}')
-            return jsonify({'error': 'Access denied'}), 403
-    except:
+    # Resolve within the site directory; symlinks can't lead outside it
+    upload_dir = resolve_within(site_htdocs(site['domain']), rel_path)
+    if upload_dir is None:
+        audit_log('FILE_UPLOAD_FAILED', f'Invalid path attempt: {rel_path}')
         return jsonify({'error': 'Invalid path'}), 400
     
-    if not os.path.exists(upload_dir) or not os.path.isdir(upload_dir):
+    st = stat_or_none(upload_dir)
+    if st is None or not stat.S_ISDIR(st.st_mode):
         return jsonify({'error': 'Upload directory not found'}), 404
     
     # Save file
@@ -1099,8 +1462,7 @@ def upload_file(site_id):
         file_path = os.path.join(upload_dir, safe_filename)
         
         # Check if file size exceeds limit (handled by Flask config MAX_CONTENT_LENGTH)
-        file.save(file_path)
-        os.chmod(file_path, 0o644)
+        save_upload(file, file_path)
         
         audit_log('FILE_UPLOAD', f'Uploaded {safe_filename} to site {site["domain"]}')
         return jsonify({'success': True, 'filename': safe_filename})
@@ -1112,7 +1474,6 @@ def upload_file(site_id):
 @login_required
 def delete_file(site_id):
     """Delete a file or directory from a site"""
-    init_components()
     site = db.get_site(site_id)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
@@ -1120,29 +1481,18 @@ def delete_file(site_id):
     # Get path from form
     rel_path = request.form.get('path', '')
     
-    # Security check
-    if '..' in rel_path or rel_path.startswith('/') or not rel_path:
-        return jsonify({'error': 'Invalid path'}), 400
-    
-    # Build full path
-    base_path = os.path.join(app.config['SITES_DIR'], site['domain'], 'htdocs')
-    full_path = os.path.join(base_path, rel_path)
-    
-    # Ensure we're still within the site directory
-    try:
-        full_path = os.path.realpath(full_path)
-        base_path = os.path.realpath(base_path)
-        if not full_path.startswith(base_path):
-            return jsonify({'error': 'Access denied'}), 403
-    except:
+    # Resolve within the site directory; symlinks can't lead outside it
+    full_path = resolve_within(site_htdocs(site['domain']), rel_path) if rel_path else None
+    if full_path is None:
         return jsonify({'error': 'Invalid path'}), 400
     
-    if not os.path.exists(full_path):
+    st = stat_or_none(full_path)
+    if st is None:
         return jsonify({'error': 'File not found'}), 404
     
     # Delete file or directory
     try:
-        if os.path.isdir(full_path):
+        if stat.S_ISDIR(st.st_mode):
             shutil.rmtree(full_path)
         else:
             os.remove(full_path)
@@ -1154,7 +1504,6 @@ def delete_file(site_id):
 @login_required
 def create_folder(site_id):
     """Create a new folder in a site"""
-    init_components()
     site = db.get_site(site_id)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
@@ -1163,25 +1512,12 @@ def create_folder(site_id):
     rel_path = request.form.get('path', '')
     folder_name = request.form.get('folder_name', '')
     
-    # Security check
-    if '..' in rel_path or rel_path.startswith('/'):
-        return jsonify({'error': 'Invalid path'}), 400
-    
-    if not folder_name or '..' in folder_name or '/' in folder_name:
+    if not is_safe_name(folder_name):
         return jsonify({'error': 'Invalid folder name'}), 400
     
-    # Build full path
-    base_path = os.path.join(app.config['SITES_DIR'], site['domain'], 'htdocs')
-    parent_dir = os.path.join(base_path, rel_path) if rel_path else base_path
-    new_folder = os.path.join(parent_dir, folder_name)
-    
-    # Ensure we're still within the site directory
-    try:
-        new_folder = os.path.realpath(new_folder)
-        base_path = os.path.realpath(base_path)
-        if not new_folder.startswith(base_path):
-            return jsonify({'error': 'Access denied'}), 403
-    except:
+    # Resolve within the site directory; symlinks can't lead outside it
+    new_folder = resolve_within(site_htdocs(site['domain']), os.path.join(rel_path, folder_name))
+    if new_folder is None:
         return jsonify({'error': 'Invalid path'}), 400
     
     if os.path.exists(new_folder):
@@ -1198,7 +1534,6 @@ def create_folder(site_id):
 @login_required
 def create_file(site_id):
     """Create a new file in a site"""
-    init_components()
     site = db.get_site(site_id)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
@@ -1207,25 +1542,12 @@ def create_file(site_id):
     rel_path = request.form.get('path', '')
     file_name = request.form.get('file_name', '')
     
-    # Security check
-    if '..' in rel_path or rel_path.startswith('/'):
-        return jsonify({'error': 'Invalid path'}), 400
-    
-    if not file_name or '..' in file_name or '/' in file_name:
+    if not is_safe_name(file_name):
         return jsonify({'error': 'Invalid file name'}), 400
     
-    # Build full path
-    base_path = os.path.join(app.config['SITES_DIR'], site['domain'], 'htdocs')
-    parent_dir = os.path.join(base_path, rel_path) if rel_path else base_path
-    new_file = os.path.join(parent_dir, file_name)
-    
-    # Ensure we're still within the site directory
-    try:
-        new_file = os.path.realpath(new_file)
-        base_path = os.path.realpath(base_path)
-        if not new_file.startswith(base_path):
-            return jsonify({'error': 'Access denied'}), 403
-    except (OSError, ValueError) as e:
+    # Resolve within the site directory; symlinks can't lead outside it
+    new_file = resolve_within(site_htdocs(site['domain']), os.path.join(rel_path, file_name))
+    if new_file is None:
         return jsonify({'error': 'Invalid path'}), 400
     
     if os.path.exists(new_file):
@@ -1245,7 +1567,6 @@ def create_file(site_id):
 @login_required
 def rename_file(site_id):
     """Rename a file or folder"""
-    init_components()
     site = db.get_site(site_id)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
@@ -1253,42 +1574,28 @@ def rename_file(site_id):
     old_path = request.form.get('old_path', '')
     new_name = request.form.get('new_name', '')
     
-    # Security checks
-    if '..' in old_path or old_path.startswith('/') or not old_path:
+    if not old_path:
         return jsonify({'error': 'Invalid path'}), 400
     
-    if not new_name or '..' in new_name or '/' in new_name:
+    if not is_safe_name(new_name):
         return jsonify({'error': 'Invalid new name'}), 400
     
-    # Build paths
-    base_path = os.path.join(app.config['SITES_DIR'], site['domain'], 'htdocs')
-    old_full_path = os.path.join(base_path, old_path)
-    
-    # Get parent directory and construct new path
-    parent_dir = os.path.dirname(old_full_path)
-    new_full_path = os.path.join(parent_dir, new_name)
-    
-    # Validate paths
-    try:
-        old_full_path = os.path.realpath(old_full_path)
-        new_full_path = os.path.realpath(new_full_path)
-        base_path = os.path.realpath(base_path)
-        
-        if not old_full_path.startswith(base_path) or not new_full_path.startswith(base_path):
-            return jsonify({'error': 'Access denied'}), 403
-    except:
+    # Resolve both paths within the site directory; the new name goes in the
+    # same directory as the old one
+    base_path = site_htdocs(site['domain'])
+    old_full_path = resolve_within(base_path, old_path)
+    new_full_path = resolve_within(base_path, os.path.join(os.path.dirname(old_path), new_name))
+    if old_full_path is None or new_full_path is None:
         return jsonify({'error': 'Invalid path'}), 400
     
-    if not os.path.exists(old_full_path):
-        return jsonify({'error': 'File not found'}), 404
-    
-    if os.path.exists(new_full_path):
-        return jsonify({'error': 'A file with that name already exists'}), 400
-    
-    # Rename
+    # Rename; existence of both paths is checked by the rename itself
     try:
-        os.rename(old_full_path, new_full_path)
+        rename_noreplace(old_full_path, new_full_path)
         return jsonify({'success': True})
+    except FileNotFoundError:
+        return jsonify({'error': 'File not found'}), 404
+    except FileExistsError:
+        return jsonify({'error': 'A file with that name already exists'}), 400
     except Exception as e:
         return jsonify({'error': f'Rename failed: {str(e)}'}), 500
 
@@ -1296,99 +1603,89 @@ def rename_file(site_id):
 @login_required
 def get_file_content(site_id):
     """Get file content for editing"""
-    init_components()
     site = db.get_site(site_id)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
     rel_path = request.args.get('path', '')
     
-    # Security check
-    if '..' in rel_path or rel_path.startswith('/') or not rel_path:
+    # Resolve within the site directory; symlinks can't lead outside it
+    full_path = resolve_within(site_htdocs(site['domain']), rel_path) if rel_path else None
+    if full_path is None:
         return jsonify({'error': 'Invalid path'}), 400
     
-    # Build full path
-    base_path = os.path.join(app.config['SITES_DIR'], site['domain'], 'htdocs')
-    full_path = os.path.join(base_path, rel_path)
-    
-    # Validate path
-    try:
-        full_path = os.path.realpath(full_path)
-        base_path = os.path.realpath(base_path)
-        if not full_path.startswith(base_path):
-            return jsonify({'error': 'Access denied'}), 403
-    except:
-        return jsonify({'error': 'Invalid path'}), 400
-    
-    if not os.path.exists(full_path) or not os.path.isfile(full_path):
+    # Only open regular files; opening a FIFO would block the request
+    file_stat = stat_or_none(full_path)
+    if file_stat is None or not stat.S_ISREG(file_stat.st_mode):
         return jsonify({'error': 'File not found'}), 404
     
-    # Read file content
+    # Check file size (limit to 5MB for editing)
+    if file_stat.st_size > 5 * 1024 * 1024:
+        return jsonify({'error': 'File too large to edit (max 5MB)'}), 400
+    
+    # Read file content, decoding the bytes in one pass
     try:
-        # Check file size (limit to 5MB for editing)
-        if os.path.getsize(full_path) > 5 * 1024 * 1024:
+        with open(full_path, 'rb') as f:
+            data = f.read(5 * 1024 * 1024 + 1)
+        if len(data) > 5 * 1024 * 1024:
             return jsonify({'error': 'File too large to edit (max 5MB)'}), 400
         
-        with open(full_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
+        content = data.decode('utf-8')
         return jsonify({'success': True, 'content': content, 'path': rel_path})
+    except (FileNotFoundError, IsADirectoryError):
+        return jsonify({'error': 'File not found'}), 404
     except UnicodeDecodeError:
         return jsonify({'error': 'File is not a text file'}), 400
     except Exception as e:
         return jsonify({'error': f'Failed to read file: {str(e)}'}), 500
 
-@app.route('/files/save/<int:site_id>', methods=['POST'])
+@app.route('/files/save/<int:site_id>', methods=['PUT'])
 @login_required
 def save_file_content(site_id):
-    """Save edited file content"""
-    init_components()
+    """Save edited file content, sent as the raw request body"""
     site = db.get_site(site_id)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
-    rel_path = request.form.get('path', '')
-    content = request.form.get('content', '')
-    
-    # Security check
-    if '..' in rel_path or rel_path.startswith('/') or not rel_path:
-        return jsonify({'error': 'Invalid path'}), 400
-    
-    # Build full path
-    base_path = os.path.join(app.config['SITES_DIR'], site['domain'], 'htdocs')
-    full_path = os.path.join(base_path, rel_path)
+    rel_path = request.args.get('path', '')
     
-    # Validate path
-    try:
-        full_path = os.path.realpath(full_path)
-        base_path = os.path.realpath(base_path)
-        if not full_path.startswith(base_path):
-            return jsonify({'error': 'Access denied'}), 403
-    except:
+    # Resolve within the site directory; symlinks can't lead outside it
+    full_path = resolve_within(site_htdocs(site['domain']), rel_path) if rel_path else None
+    if full_path is None:
         return jsonify({'error': 'Invalid path'}), 400
     
-    if not os.path.exists(full_path) or not os.path.isfile(full_path):
+    st = stat_or_none(full_path)
+    if st is None or not stat.S_ISREG(st.st_mode):
         return jsonify({'error': 'File not found'}), 404
     
-    # Save file
+    # Save file: stream the body into a temp file beside the original and
+    # swap it in, so a failed save never leaves a half-written file
+    tmp_path = None
     try:
-        with open(full_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        fd, tmp_path = tempfile.mkstemp(prefix='.lalapanel-', dir=os.path.dirname(full_path))
+        with os.fdopen(fd, 'wb') as f:
+            shutil.copyfileobj(request.stream, f, length=1024 * 1024)
+            os.fchmod(f.fileno(), stat.S_IMODE(st.st_mode))
+            try:
+                os.fchown(f.fileno(), st.st_uid, st.st_gid)
+            except PermissionError:
+                pass  # Not running as root; the file keeps our ownership
+        os.replace(tmp_path, full_path)
         
         return jsonify({'success': True})
     except Exception as e:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
         return jsonify({'error': f'Failed to save file: {str(e)}'}), 500
 
 @app.route('/files/compress/<int:site_id>', methods=['POST'])
 @login_required
 def compress_files(site_id):
     """Compress files/folders to a zip archive"""
-    init_components()
     site = db.get_site(site_id)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
-    import zipfile
     
     paths = request.form.getlist('paths[]')
     archive_name = request.form.get('archive_name', 'archive.zip')
@@ -1399,80 +1696,82 @@ def compress_files(site_id):
         archive_name += '.zip'
     
     # Security checks
-    for path in paths:
-        if '..' in path or path.startswith('/'):
-            return jsonify({'error': 'Invalid path'}), 400
-    
-    if '..' in current_path or current_path.startswith('/'):
-        return jsonify({'error': 'Invalid path'}), 400
-    
-    if '..' in archive_name or '/' in archive_name:
+    if not is_safe_name(archive_name):
         return jsonify({'error': 'Invalid archive name'}), 400
     
-    # Build paths
-    base_path = os.path.join(app.config['SITES_DIR'], site['domain'], 'htdocs')
-    archive_path = os.path.join(base_path, current_path, archive_name) if current_path else os.path.join(base_path, archive_name)
+    # Resolve every path before creating the archive, so a rejected path
+    # doesn't leave a partial zip behind
+    base_path = site_htdocs(site['domain'])
+    archive_path = resolve_within(base_path, os.path.join(current_path, archive_name))
+    full_paths = [resolve_within(base_path, rel_path) for rel_path in paths]
+    if archive_path is None or None in full_paths:
+        return jsonify({'error': 'Invalid path'}), 400
     
     # Create zip file
     try:
         with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for rel_path in paths:
-                full_path = os.path.join(base_path, rel_path)
-                
-                # Validate path
-                full_path = os.path.realpath(full_path)
-                base_path_real = os.path.realpath(base_path)
-                if not full_path.startswith(base_path_real):
-                    return jsonify({'error': 'Access denied'}), 403
-                
-                if not os.path.exists(full_path):
-                    continue
-                
-                # Add to zip
-                if os.path.isfile(full_path):
-                    zipf.write(full_path, os.path.basename(full_path))
-                elif os.path.isdir(full_path):
-                    for root, dirs, files in os.walk(full_path):
-                        for file in files:
-                            file_path = os.path.join(root, file)
-                            arcname = os.path.relpath(file_path, os.path.dirname(full_path))
-                            zipf.write(file_path, arcname)
+            for full_path in full_paths:
+                # Add to zip; paths that have gone away add nothing
+                for file_path, arcname in zip_members(full_path):
+                    zipf.write(file_path, arcname, compress_type=zip_compress_type(file_path))
         
         return jsonify({'success': True, 'archive_name': archive_name})
     except Exception as e:
         return jsonify({'error': f'Compression failed: {str(e)}'}), 500
 
+@app.route('/files/download-zip/<int:site_id>')
+@login_required
+def download_zip(site_id):
+    """Download selected files/folders as a zip built on the fly"""
+    site = db.get_site(site_id)
+    if not site:
+        flash('Site not found', 'error')
+        return redirect(url_for('file_manager'))
+    
+    paths = request.args.getlist('paths')
+    if not paths:
+        flash('No files selected', 'error')
+        return redirect(url_for('file_manager'))
+    
+    # Validate everything before the response starts
+    base_path = site_htdocs(site['domain'])
+    full_paths = [resolve_within(base_path, path) for path in paths]
+    if None in full_paths:
+        flash('Invalid path', 'error')
+        return redirect(url_for('file_manager'))
+    
+    members = (member for full_path in full_paths for member in zip_members(full_path))
+    if len(full_paths) == 1:
+        archive_name = f"{os.path.basename(full_paths[0]) or site['domain']}.zip"
+    else:
+        archive_name = f"{site['domain']}.zip"
+    
+    audit_log('FILE_DOWNLOAD_ZIP', f'Streaming {len(full_paths)} item(s) from site {site["domain"]}')
+    response = app.response_class(stream_zip(members), mimetype='application/zip')
+    response.headers.set('Content-Disposition', 'attachment', filename=archive_name)
+    # Let nginx pass chunks through as they are produced
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/files/extract/<int:site_id>', methods=['POST'])
 @login_required
 def extract_archive(site_id):
     """Extract a zip archive"""
-    init_components()
     site = db.get_site(site_id)
     if not site:
         return jsonify({'error': 'Site not found'}), 404
     
-    import zipfile
     
     archive_path = request.form.get('path', '')
     
-    # Security check
-    if '..' in archive_path or archive_path.startswith('/') or not archive_path:
-        return jsonify({'error': 'Invalid path'}), 400
-    
-    # Build paths
-    base_path = os.path.join(app.config['SITES_DIR'], site['domain'], 'htdocs')
-    full_archive_path = os.path.join(base_path, archive_path)
-    
-    # Validate path
-    try:
-        full_archive_path = os.path.realpath(full_archive_path)
-        base_path = os.path.realpath(base_path)
-        if not full_archive_path.startswith(base_path):
-            return jsonify({'error': 'Access denied'}), 403
-    except:
+    # Resolve within the site directory; symlinks can't lead outside it
+    base_path = site_htdocs(site['domain'])
+    full_archive_path = resolve_within(base_path, archive_path) if archive_path else None
+    if full_archive_path is None:
         return jsonify({'error': 'Invalid path'}), 400
     
-    if not os.path.exists(full_archive_path) or not os.path.isfile(full_archive_path):
+    st = stat_or_none(full_archive_path)
+    if st is None or not stat.S_ISREG(st.st_mode):
         return jsonify({'error': 'Archive not found'}), 404
     
     # Extract to same directory as archive
@@ -1481,55 +1780,85 @@ def extract_archive(site_id):
     try:
         with zipfile.ZipFile(full_archive_path, 'r') as zipf:
             # Security check: validate all paths in archive
-            for member in zipf.namelist():
-                member_path = os.path.join(extract_dir, member)
+            members = zipf.infolist()
+            targets = []
+            for member in members:
+                member_path = os.path.join(extract_dir, member.filename)
                 member_path = os.path.realpath(member_path)
-                if not member_path.startswith(base_path):
+                if not is_within(member_path, base_path):
                     return jsonify({'error': 'Archive contains invalid paths'}), 400
+                targets.append((member, member_path))
+            
+            # Refuse zip bombs before writing anything: cap the total size,
+            # leave room on disk, and reject implausibly compressed members
+            # (only above 1MB, where a high ratio can't be ordinary text)
+            total_size = sum(member.file_size for member in members)
+            if total_size > app.config['MAX_EXTRACT_SIZE']:
+                return jsonify({'error': 'Archive is too large to extract'}), 400
+            if total_size > shutil.disk_usage(extract_dir).free:
+                return jsonify({'error': 'Not enough disk space to extract archive'}), 400
+            max_ratio = app.config['MAX_COMPRESSION_RATIO']
+            for member in members:
+                if member.file_size > 1024 * 1024 and member.file_size > member.compress_size * max_ratio:
+                    return jsonify({'error': 'Archive has a suspicious compression ratio'}), 400
             
-            # Extract
-            zipf.extractall(extract_dir)
+        # Extract in the background; the page polls the job until it finishes
+        job_id = secrets.token_urlsafe(8)
+        with _extract_jobs_lock:
+            _extract_jobs[job_id] = {'status': 'running', 'error': None}
+        _extract_executor.submit(run_extract_job, job_id, full_archive_path, targets)
         
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'job_id': job_id}), 202
     except zipfile.BadZipFile:
         return jsonify({'error': 'Invalid or corrupted zip file'}), 400
     except Exception as e:
         return jsonify({'error': f'Extraction failed: {str(e)}'}), 500
 
+@app.route('/files/jobs/<job_id>')
+@login_required
+def extract_job_status(job_id):
+    """Report the progress of a background extraction"""
+    with _extract_jobs_lock:
+        job = _extract_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
 @app.route('/system/info')
 @login_required
 def system_info():
     """System information and statistics"""
-    init_components()
-    
+    global _metrics_viewed_at
     try:
-        # Get system stats
-        import psutil
-        
-        # CPU usage
-        cpu_percent = psutil.cpu_percent(interval=1)
-        cpu_count = psutil.cpu_count()
-        
-        # Memory usage
-        memory = psutil.virtual_memory()
-        
-        # Disk usage
-        disk = psutil.disk_usage('/')
-        
-        # Load average
-        load_avg = os.getloadavg() if hasattr(os, 'getloadavg') else (0, 0, 0)
-        
-        # Service status
+        if psutil is None:
+            raise ImportError('psutil')
+        
+        # Get system stats from the poller's latest snapshot; only requests
+        # before its first poll measure directly
+        _metrics_viewed_at = time.monotonic()
+        metrics = _METRICS
+        if not metrics:
+            psutil.cpu_percent(interval=None)
+            time.sleep(0.1)
+            metrics = collect_metrics()
+        elif _metrics_viewed_at - metrics['services_at'] > 2 * _metrics_poller.interval:
+            # First view in a while; the poller stopped asking systemd
+            metrics = refresh_service_metrics()
+        
+        cpu_percent = metrics['cpu_percent']
+        cpu_count = metrics['cpu_count']
+        memory = metrics['memory']
+        disk = metrics['disk']
+        load_avg = metrics['load_avg']
+        
+        # Service status, including PHP-FPM
+        php_units = {version: f'php{version}-fpm' for version in app.config['AVAILABLE_PHP_VERSIONS']}
+        statuses = metrics['services']
         services = {
-            'nginx': get_service_status('nginx'),
-            'mariadb': get_service_status('mariadb'),
+            'nginx': statuses['nginx'],
+            'mariadb': statuses['mariadb'],
         }
-        
-        # Check PHP-FPM services
-        php_services = {}
-        for version in app.config['AVAILABLE_PHP_VERSIONS']:
-            service_name = f'php{version}-fpm'
-            php_services[version] = get_service_status(service_name)
+        php_services = {version: statuses[unit] for version, unit in php_units.items()}
         
         stats = {
             'cpu': {
@@ -1565,22 +1894,15 @@ def system_info():
 @login_required
 def service_manager():
     """Service management page"""
-    init_components()
-    return render_template('service_manager.html', 
-                         php_versions=app.config['AVAILABLE_PHP_VERSIONS'])
+    return render_template('service_manager.html')
 
 @app.route('/system/services/restart', methods=['POST'])
 @login_required
 def restart_service():
     """Restart a service"""
-    init_components()
     service_name = request.form.get('service')
     
-    allowed_services = ['nginx', 'mariadb']
-    for version in app.config['AVAILABLE_PHP_VERSIONS']:
-        allowed_services.append(f'php{version}-fpm')
-    
-    if service_name not in allowed_services:
+    if service_name not in managed_services():
         flash('Invalid service name', 'error')
         return redirect(url_for('service_manager'))
     
@@ -1591,6 +1913,8 @@ def restart_service():
             capture_output=True,
             text=True
         )
+        if _METRICS:
+            refresh_service_metrics()
         flash(f'Service {service_name} restarted successfully', 'success')
     except subprocess.CalledProcessError as e:
         flash(f'Failed to restart {service_name}: {e.stderr}', 'error')
@@ -1599,23 +1923,32 @@ def restart_service():
     
     return redirect(url_for('service_manager'))
 
-def get_service_status(service_name):
-    """Get the status of a systemd service"""
+def query_service_statuses(service_names):
+    """Ask systemd for the current state of several services in one call
+    
+    Returns:
+        dict: service name -> True if active
+    """
+    # systemctl prints one state per unit, in the order given
     try:
         result = subprocess.run(
-            ['/usr/bin/systemctl', 'is-active', service_name],
+            ['/usr/bin/systemctl', 'is-active', *service_names],
             capture_output=True,
             text=True
         )
-        return result.stdout.strip() == 'active'
-    except:
-        return False
+        states = result.stdout.splitlines()
+    except Exception:
+        states = []
+    
+    return {
+        name: index < len(states) and states[index].strip() == 'active'
+        for index, name in enumerate(service_names)
+    }
 
 @app.route('/settings')
 @login_required
 def panel_settings():
     """Panel settings page"""
-    init_components()
     settings = db.get_all_panel_settings()
     return render_template('panel_settings.html', settings=settings)
 
@@ -1623,8 +1956,6 @@ def panel_settings():
 @login_required
 def save_panel_settings():
     """Save panel settings"""
-    init_components()
-    
     panel_domain = request.form.get('panel_domain', '').strip()
     panel_port = request.form.get('panel_port', '8080')
     
@@ -1657,8 +1988,6 @@ def save_panel_settings():
 @login_required
 def request_panel_ssl():
     """Request SSL certificate for panel domain"""
-    init_components()
-    
     panel_domain = db.get_panel_setting('panel_domain')
     if not panel_domain:
         flash('Panel domain not set', 'error')
@@ -1695,8 +2024,6 @@ def request_panel_ssl():
 @login_required
 def disable_panel_ssl():
     """Disable SSL for panel"""
-    init_components()
-    
     try:
         panel_domain = db.get_panel_setting('panel_domain')
         
@@ -1716,8 +2043,6 @@ def disable_panel_ssl():
 @login_required
 def restart_panel_service():
     """Restart the panel service"""
-    init_components()
-    
     try:
         # Restart lalapanel service
         subprocess.run(
@@ -1767,9 +2092,6 @@ if __name__ == '__main__':
     except Exception as e:
         print(f"Warning: Could not create panel nginx config: {e}")
     
-    # Clean old login attempts on startup
-    db.clear_old_login_attempts()
-    
     # Get panel port from database settings if available, otherwise use config default
     panel_port = db.get_panel_port(app.config['PANEL_PORT'])
     
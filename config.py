@@ -3,63 +3,94 @@ Configuration settings for Lala Panel
 """
 import os
 import secrets
+from dataclasses import asdict, dataclass
+from types import MappingProxyType
+from typing import Optional
 
 # Paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_DIR = os.environ.get('CONFIG_DIR', '/etc/lalapanel')
 SITES_DIR = os.environ.get('SITES_DIR', '/var/www')
 LOG_DIR = os.environ.get('LOG_DIR', '/var/log/lalapanel')
+CACHE_DIR = os.environ.get('CACHE_DIR', '/var/cache/lalapanel')
 
+# File types accepted by the file manager upload
+ALLOWED_EXTENSIONS = frozenset({'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'zip', 'tar', 'gz',
+                                'php', 'html', 'css', 'js', 'json', 'xml', 'svg', 'md', 'sql'})
+
+@dataclass(frozen=True)
 class Config:
-    """Base configuration"""
-    # Flask settings
-    SECRET_KEY = os.environ.get('SECRET_KEY') or secrets.token_hex(32)
+    """Base configuration; use the shared, immutable CONFIG instance"""
+    
+    @classmethod
+    def secret_key(cls):
+        """Flask secret key from the environment, or a random one generated
+        once per process; app.py resolves it at import"""
+        if not hasattr(cls, '_secret_key'):
+            cls._secret_key = os.environ.get('SECRET_KEY') or secrets.token_hex(32)
+        return cls._secret_key
+    
+    # Set LALAPANEL_TESTING=1 before importing app to skip creating the
+    # database and managers at import time
+    TESTING: bool = os.environ.get('LALAPANEL_TESTING') == '1'
     
     # Paths
-    BASE_DIR = BASE_DIR
-    CONFIG_DIR = CONFIG_DIR
-    SITES_DIR = SITES_DIR
-    LOG_DIR = LOG_DIR
-    NGINX_SITES_AVAILABLE = '/etc/nginx/sites-available'
-    NGINX_SITES_ENABLED = '/etc/nginx/sites-enabled'
+    BASE_DIR: str = BASE_DIR
+    CONFIG_DIR: str = CONFIG_DIR
+    SITES_DIR: str = SITES_DIR
+    SITES_DIR_REAL: str = os.path.realpath(SITES_DIR)  # Resolved once; SITES_DIR doesn't move
+    LOG_DIR: str = LOG_DIR
+    CACHE_DIR: str = CACHE_DIR
+    NGINX_SITES_AVAILABLE: str = '/etc/nginx/sites-available'
+    NGINX_SITES_ENABLED: str = '/etc/nginx/sites-enabled'
+    
+    # Templates
+    TEMPLATES_AUTO_RELOAD: bool = False  # Templates only change on upgrade/restart
+    JINJA_CACHE_DIR: str = os.path.join(CACHE_DIR, 'jinja')
     
     # PHP-FPM
-    PHP_FPM_SOCKET_DIR = '/run/php'
-    AVAILABLE_PHP_VERSIONS = ['8.5', '8.4', '8.3', '8.2', '8.1']
+    PHP_FPM_SOCKET_DIR: str = '/run/php'
+    AVAILABLE_PHP_VERSIONS: tuple = ('8.5', '8.4', '8.3', '8.2', '8.1')
     
     # Database
-    DATABASE_PATH = os.path.join(CONFIG_DIR, 'lalapanel.db')
-    MARIADB_HOST = 'localhost'
-    MARIADB_PORT = 3306
-    MARIADB_ROOT_PASSWORD = os.environ.get('MARIADB_ROOT_PASSWORD', '')
+    DATABASE_PATH: str = os.path.join(CONFIG_DIR, 'lalapanel.db')
+    MARIADB_HOST: str = 'localhost'
+    MARIADB_PORT: int = 3306
+    MARIADB_ROOT_PASSWORD: str = os.environ.get('MARIADB_ROOT_PASSWORD', '')
     
     # Security
-    MAX_LOGIN_ATTEMPTS = 5
-    RATE_LIMIT_STORAGE_URL = 'memory://'
+    MAX_LOGIN_ATTEMPTS: int = 5
+    RATE_LIMIT_STORAGE_URL: str = 'memory://'
     
     # Session Security
-    SESSION_COOKIE_SECURE = False  # Set dynamically based on request scheme (HTTP/HTTPS)
-    SESSION_COOKIE_HTTPONLY = True  # Prevent JavaScript access to session cookie
-    SESSION_COOKIE_SAMESITE = 'Lax'  # CSRF protection
-    PERMANENT_SESSION_LIFETIME = 3600  # 1 hour session timeout
+    SESSION_COOKIE_SECURE: bool = False  # Set dynamically based on request scheme (HTTP/HTTPS)
+    SESSION_COOKIE_HTTPONLY: bool = True  # Prevent JavaScript access to session cookie
+    SESSION_COOKIE_SAMESITE: str = 'Lax'  # CSRF protection
+    PERMANENT_SESSION_LIFETIME: int = 3600  # 1 hour session timeout
     
     # CSRF Protection
-    WTF_CSRF_ENABLED = True
-    WTF_CSRF_TIME_LIMIT = None  # No time limit for CSRF tokens
+    WTF_CSRF_ENABLED: bool = True
+    WTF_CSRF_TIME_LIMIT: Optional[int] = None  # No time limit for CSRF tokens
     
     # File Upload Security
-    MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100 MB max file upload
-    ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'zip', 'tar', 'gz', 
-                         'php', 'html', 'css', 'js', 'json', 'xml', 'svg', 'md', 'sql'}
+    MAX_CONTENT_LENGTH: int = 100 * 1024 * 1024  # 100 MB max file upload
+    MAX_EXTRACT_SIZE: int = 2 * 1024 * 1024 * 1024  # 2 GB max uncompressed archive contents
+    MAX_COMPRESSION_RATIO: int = 100  # Larger archive members beyond this ratio are refused
+    ALLOWED_EXTENSIONS: frozenset = ALLOWED_EXTENSIONS
     
     # SSL
-    LETSENCRYPT_EMAIL = os.environ.get('LETSENCRYPT_EMAIL', 'admin@localhost')
-    CERTBOT_PATH = '/usr/bin/certbot'
+    LETSENCRYPT_EMAIL: str = os.environ.get('LETSENCRYPT_EMAIL', 'admin@localhost')
+    CERTBOT_PATH: str = '/usr/bin/certbot'
     
     # Modern SSL/TLS cipher suite (Mozilla Intermediate compatibility)
     # https://ssl-config.mozilla.org/
-    SSL_CIPHERS = 'ECDHE-ECDSA-AES128-GCM-SHA256:ECDHE-RSA-AES128-GCM-SHA256:ECDHE-ECDSA-AES256-GCM-SHA384:ECDHE-RSA-AES256-GCM-SHA384:ECDHE-ECDSA-CHACHA20-POLY1305:ECDHE-RSA-CHACHA20-POLY1305:DHE-RSA-AES128-GCM-SHA256:DHE-RSA-AES256-GCM-SHA384'
+    SSL_CIPHERS: str = 'ECDHE-ECDSA-AES128-GCM-SHA256:ECDHE-RSA-AES128-GCM-SHA256:ECDHE-ECDSA-AES256-GCM-SHA384:ECDHE-RSA-AES256-GCM-SHA384:ECDHE-ECDSA-CHACHA20-POLY1305:ECDHE-RSA-CHACHA20-POLY1305:DHE-RSA-AES128-GCM-SHA256:DHE-RSA-AES256-GCM-SHA384'
     
     # Panel settings
-    PANEL_PORT = 8080
-    PANEL_HOST = '127.0.0.1'  # Listen only on localhost for security
+    PANEL_PORT: int = 8080
+    PANEL_HOST: str = '127.0.0.1'  # Listen only on localhost for security
+
+CONFIG = Config()
+
+# Read-only view of the settings, for loading into Flask's app.config
+CONFIG_MAPPING = MappingProxyType(asdict(CONFIG))
@@ -3,24 +3,123 @@ Database models for Lala Panel
 """
 import sqlite3
 import os
+import queue
+import itertools
+import threading
 import logging
 from datetime import datetime
 from contextlib import contextmanager
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
+# Bump whenever _init_db changes the schema, so existing databases rerun it
+SCHEMA_VERSION = 3
+
+# INSERT ... RETURNING is available from SQLite 3.35
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+def _insert_returning_id(cursor, query, params):
+    """Run an INSERT and return the new row's id"""
+    if _HAS_RETURNING:
+        return cursor.execute(f'{query} RETURNING id', params).fetchone()[0]
+    cursor.execute(query, params)
+    return cursor.lastrowid
+
+def _bulk_insert(conn, query, rows, chunk_size=200):
+    """Insert rows using multi-row VALUES lists, chunk_size rows per statement
+    
+    Args:
+        query: INSERT statement up to and including 'VALUES'
+        rows: sequence of equal-length parameter tuples
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    row_placeholder = '(' + ', '.join('?' * len(rows[0])) + ')'
+    for start in range(0, len(rows), chunk_size):
+        batch = rows[start:start + chunk_size]
+        placeholders = ', '.join([row_placeholder] * len(batch))
+        conn.execute(f'{query} {placeholders}', [value for row in batch for value in row])
+
+@lru_cache(maxsize=32)
+def _update_site_sql(fields):
+    """Build the UPDATE statement for a tuple of site column names
+    
+    The same text for the same fields lets sqlite3 reuse its prepared statement.
+    """
+    assignments = ''.join(f'{field} = ?, ' for field in fields)
+    return f'UPDATE sites SET {assignments}updated_at = CURRENT_TIMESTAMP WHERE id = ?'
+
 class Database:
     """Database handler for Lala Panel"""
     
-    def __init__(self, db_path):
+    def __init__(self, db_path, read_pool_size=None):
         self.db_path = db_path
+        # Create directory if it doesn't exist
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        
+        # SQLite allows a single writer at a time, so all writes share one
+        # connection; readers get their own so they never queue behind it
+        writer = self._connect()
+        # WAL is stored in the database file, so it only needs setting once
+        writer.execute('PRAGMA journal_mode=WAL')
+        self._write_pool = queue.LifoQueue(maxsize=1)
+        self._write_pool.put(writer)
+        self._read_pool = queue.LifoQueue(maxsize=read_pool_size or os.cpu_count() or 4)
+        
+        # Bumped after every committed change to the sites table
+        self._sites_versions = itertools.count(1)
+        self.sites_version = 0
+        
+        # Results of frequent read queries, dropped on every write
+        self._list_cache = {}
+        self._list_generation = 0
+        self._list_cache_lock = threading.Lock()
+        
+        # All panel settings, loaded on first use and kept in step by
+        # set_panel_setting
+        self._settings_cache = None
+        self._settings_lock = threading.Lock()
         self._init_db()
+        
+        while not self._read_pool.full():
+            reader = self._connect()
+            # Readers never write, so they need no implicit transactions
+            reader.isolation_level = None
+            self._read_pool.put(reader)
+    
+    def _connect(self):
+        """Open a new SQLite connection"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=512)
+        conn.row_factory = sqlite3.Row
+        self._configure(conn)
+        return conn
+    
+    @staticmethod
+    def _configure(conn):
+        """Apply per-connection PRAGMAs
+        
+        WAL lets readers run alongside the writer, and synchronous=NORMAL only
+        fsyncs at checkpoints, which is safe in WAL mode. Reads are served
+        from a 256 MiB memory map instead of read() calls.
+        """
+        conn.executescript('''
+            PRAGMA busy_timeout=5000;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA cache_size=-20000;
+            PRAGMA temp_store=MEMORY;
+            PRAGMA mmap_size=268435456;
+            PRAGMA foreign_keys=ON;
+        ''')
     
     @contextmanager
     def get_connection(self):
-        """Get database connection with context manager"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        """Get the shared write connection with context manager
+        
+        Blocks while another thread holds it, so do not nest calls.
+        """
+        conn = self._write_pool.get()
         try:
             yield conn
             conn.commit()
@@ -28,14 +127,56 @@ class Database:
             conn.rollback()
             raise
         finally:
-            conn.close()
+            self._write_pool.put(conn)
     
-    def _init_db(self):
-        """Initialize database tables"""
-        # Create directory if it doesn't exist
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+    @contextmanager
+    def read_connection(self):
+        """Get a pooled connection for read-only queries with context manager"""
+        conn = self._read_pool.get()
+        try:
+            yield conn
+        finally:
+            self._read_pool.put(conn)
+    
+    def _bump_sites_version(self):
+        """Mark cached views of the sites table as stale"""
+        self.sites_version = next(self._sites_versions)
+        self._invalidate_lists()
+    
+    def _invalidate_lists(self):
+        """Drop cached list query results after a write"""
+        with self._list_cache_lock:
+            self._list_generation += 1
+            self._list_cache.clear()
+    
+    def _cached_query(self, key, query, params=()):
+        """Run a read query, reusing its rows until the next write"""
+        with self._list_cache_lock:
+            rows = self._list_cache.get(key)
+            generation = self._list_generation
+        
+        if rows is None:
+            with self.read_connection() as conn:
+                rows = conn.execute(query, params).fetchall()
+            # Don't store rows read before a write that finished meanwhile
+            with self._list_cache_lock:
+                if generation == self._list_generation:
+                    # Per-id entries could otherwise grow without bound
+                    if len(self._list_cache) >= 1024:
+                        self._list_cache.clear()
+                    self._list_cache[key] = rows
         
+        return rows
+    
+    def _cached_list(self, key, query):
+        """Run a list query through the cache, returning a fresh list"""
+        return list(self._cached_query(key, query))
+    
+    def _init_db(self):
+        """Initialize database tables, unless the schema is already current"""
         with self.get_connection() as conn:
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+                return
             cursor = conn.cursor()
             
             # Users table
@@ -73,6 +214,8 @@ class Database:
                     FOREIGN KEY (site_id) REFERENCES sites (id) ON DELETE CASCADE
                 )
             ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_databases_site_id ON databases (site_id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_databases_created ON databases (created_at)')
             
             # FTP/SSH users table
             cursor.execute('''
@@ -85,6 +228,8 @@ class Database:
                     FOREIGN KEY (site_id) REFERENCES sites (id) ON DELETE CASCADE
                 )
             ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_ftp_users_site_id ON ftp_users (site_id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_ftp_users_created ON ftp_users (created_at)')
             
             # Login attempts table for rate limiting
             cursor.execute('''
@@ -94,6 +239,9 @@ class Database:
                     attempted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
+            # Rate limiting is tracked in memory now, so nothing reads these
+            cursor.execute('DROP INDEX IF EXISTS idx_login_attempts_ip_time')
+            cursor.execute('DROP INDEX IF EXISTS idx_login_attempts_time')
             
             # Panel settings table
             cursor.execute('''
@@ -105,125 +253,180 @@ class Database:
                 )
             ''')
             
-            # Initialize default settings if not exists
-            cursor.execute('SELECT COUNT(*) FROM panel_settings WHERE setting_key = ?', ('panel_domain',))
-            if cursor.fetchone()[0] == 0:
-                cursor.execute('INSERT INTO panel_settings (setting_key, setting_value) VALUES (?, ?)', 
-                              ('panel_domain', ''))
-                cursor.execute('INSERT INTO panel_settings (setting_key, setting_value) VALUES (?, ?)', 
-                              ('panel_port', '8080'))
-                cursor.execute('INSERT INTO panel_settings (setting_key, setting_value) VALUES (?, ?)', 
-                              ('panel_ssl_enabled', '0'))
+            # Initialize default settings; existing keys are left alone
+            cursor.executemany(
+                'INSERT OR IGNORE INTO panel_settings (setting_key, setting_value) VALUES (?, ?)',
+                [('panel_domain', ''), ('panel_port', '8080'), ('panel_ssl_enabled', '0')]
+            )
+            
+            cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
     
     def create_user(self, username, password_hash):
         """Create a new user"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute(
+            return _insert_returning_id(
+                cursor,
                 'INSERT INTO users (username, password_hash) VALUES (?, ?)',
                 (username, password_hash)
             )
-            return cursor.lastrowid
+    
+    def set_user_password(self, username, password_hash):
+        """Create a user, or replace the password of an existing one"""
+        with self.get_connection() as conn:
+            conn.execute('''
+                INSERT INTO users (username, password_hash) VALUES (?, ?)
+                ON CONFLICT(username) DO UPDATE SET password_hash = excluded.password_hash
+            ''', (username, password_hash))
     
     def get_user(self, username):
         """Get user by username"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
-            return cursor.fetchone()
+        with self.read_connection() as conn:
+            return conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
     
     def create_site(self, domain, php_version, ssl_enabled=False):
         """Create a new site"""
         with self.get_connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
             cursor = conn.cursor()
-            cursor.execute(
+            site_id = _insert_returning_id(
+                cursor,
                 'INSERT INTO sites (domain, php_version, ssl_enabled) VALUES (?, ?, ?)',
                 (domain, php_version, ssl_enabled)
             )
-            return cursor.lastrowid
+        self._bump_sites_version()
+        return site_id
     
+    def create_sites_bulk(self, rows):
+        """Create several sites in one transaction
+        
+        Args:
+            rows: iterable of (domain, php_version, ssl_enabled) tuples
+        """
+        with self.get_connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            _bulk_insert(conn, 'INSERT INTO sites (domain, php_version, ssl_enabled) VALUES', rows)
+        self._bump_sites_version()
+
     def get_site(self, site_id):
         """Get site by ID"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM sites WHERE id = ?', (site_id,))
-            return cursor.fetchone()
+        rows = self._cached_query(('site', site_id), 'SELECT * FROM sites WHERE id = ?', (site_id,))
+        return rows[0] if rows else None
     
     def get_site_by_domain(self, domain):
         """Get site by domain"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM sites WHERE domain = ?', (domain,))
-            return cursor.fetchone()
+        with self.read_connection() as conn:
+            return conn.execute('SELECT * FROM sites WHERE domain = ?', (domain,)).fetchone()
     
     def get_all_sites(self):
         """Get all sites"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM sites ORDER BY created_at DESC')
-            return cursor.fetchall()
+        return self._cached_list('sites', 'SELECT * FROM sites ORDER BY created_at DESC')
     
     def update_site(self, site_id, **kwargs):
         """Update site attributes"""
-        fields = []
-        values = []
-        for key, value in kwargs.items():
-            fields.append(f"{key} = ?")
-            values.append(value)
-        
-        values.append(site_id)
+        values = [*kwargs.values(), site_id]
         
         with self.get_connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
             cursor = conn.cursor()
-            cursor.execute(
-                f'UPDATE sites SET {", ".join(fields)}, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
-                values
-            )
+            cursor.execute(_update_site_sql(tuple(kwargs)), values)
+        self._bump_sites_version()
     
     def delete_site(self, site_id):
-        """Delete a site"""
+        """Delete a site along with its database and FTP user records
+        
+        Everything is removed in one transaction, so there is a single commit
+        however many child rows the site has.
+        """
         with self.get_connection() as conn:
             cursor = conn.cursor()
+            conn.execute('BEGIN IMMEDIATE')
+            cursor.execute('DELETE FROM databases WHERE site_id = ?', (site_id,))
+            cursor.execute('DELETE FROM ftp_users WHERE site_id = ?', (site_id,))
             cursor.execute('DELETE FROM sites WHERE id = ?', (site_id,))
+        self._bump_sites_version()
     
     def create_database(self, site_id, db_name, db_user, db_password):
         """Create a database record"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute(
+            row_id = _insert_returning_id(
+                cursor,
                 'INSERT INTO databases (site_id, db_name, db_user, db_password) VALUES (?, ?, ?, ?)',
                 (site_id, db_name, db_user, db_password)
             )
-            return cursor.lastrowid
+        self._invalidate_lists()
+        return row_id
     
+    def create_databases_bulk(self, rows):
+        """Create several database records in one transaction
+        
+        Args:
+            rows: iterable of (site_id, db_name, db_user, db_password) tuples
+        """
+        with self.get_connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            _bulk_insert(conn, 'INSERT INTO databases (site_id, db_name, db_user, db_password) VALUES', rows)
+        self._invalidate_lists()
+
     def get_databases_for_site(self, site_id):
         """Get all databases for a site"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM databases WHERE site_id = ?', (site_id,))
-            return cursor.fetchall()
+        with self.read_connection() as conn:
+            return conn.execute('SELECT * FROM databases WHERE site_id = ?', (site_id,)).fetchall()
+    
+    def get_site_with_databases(self, site_id):
+        """Get a site and all its databases in a single query
+        
+        Returns:
+            tuple: (site, databases) as dicts; site is None if it does not exist
+        """
+        with self.read_connection() as conn:
+            rows = conn.execute('''
+                SELECT s.*, d.id AS db_id, d.db_name, d.db_user, d.db_password,
+                       d.created_at AS db_created_at
+                FROM sites s
+                LEFT JOIN databases d ON d.site_id = s.id
+                WHERE s.id = ?
+                ORDER BY d.id
+            ''', (site_id,)).fetchall()
+        
+        if not rows:
+            return None, []
+        
+        site = {key: rows[0][key] for key in rows[0].keys() if not key.startswith('db_')}
+        databases = [
+            {
+                'id': row['db_id'],
+                'site_id': site['id'],
+                'db_name': row['db_name'],
+                'db_user': row['db_user'],
+                'db_password': row['db_password'],
+                'created_at': row['db_created_at'],
+            }
+            for row in rows if row['db_id'] is not None
+        ]
+        return site, databases
     
     def get_all_databases(self):
         """Get all databases"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT d.*, s.domain 
-                FROM databases d
-                LEFT JOIN sites s ON d.site_id = s.id
-                ORDER BY d.created_at DESC
-            ''')
-            return cursor.fetchall()
+        return self._cached_list('databases', '''
+            SELECT d.id, d.site_id, d.db_name, d.db_user, d.db_password, d.created_at, s.domain
+            FROM databases d
+            LEFT JOIN sites s ON d.site_id = s.id
+            ORDER BY d.created_at DESC
+        ''')
     
     def delete_database(self, db_id):
         """Delete a database record"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM databases WHERE id = ?', (db_id,))
+        self._invalidate_lists()
     
     def record_login_attempt(self, ip_address):
         """Record a login attempt"""
         with self.get_connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
             cursor = conn.cursor()
             cursor.execute(
                 'INSERT INTO login_attempts (ip_address) VALUES (?)',
@@ -232,14 +435,12 @@ class Database:
     
     def get_recent_login_attempts(self, ip_address, minutes=15):
         """Get recent login attempts for an IP"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
+        with self.read_connection() as conn:
+            result = conn.execute('''
                 SELECT COUNT(*) as count FROM login_attempts 
                 WHERE ip_address = ? 
                 AND attempted_at > datetime('now', '-' || ? || ' minutes')
-            ''', (ip_address, minutes))
-            result = cursor.fetchone()
+            ''', (ip_address, minutes)).fetchone()
             return result['count'] if result else 0
     
     def clear_old_login_attempts(self, hours=24):
@@ -255,44 +456,64 @@ class Database:
         """Create a FTP/SSH user record"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute(
+            row_id = _insert_returning_id(
+                cursor,
                 'INSERT INTO ftp_users (site_id, username, access_type) VALUES (?, ?, ?)',
                 (site_id, username, access_type)
             )
-            return cursor.lastrowid
+        self._invalidate_lists()
+        return row_id
     
+    def create_ftp_users_bulk(self, rows):
+        """Create several FTP/SSH user records in one transaction
+        
+        Args:
+            rows: iterable of (site_id, username, access_type) tuples
+        """
+        with self.get_connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            _bulk_insert(conn, 'INSERT INTO ftp_users (site_id, username, access_type) VALUES', rows)
+        self._invalidate_lists()
+
     def get_all_ftp_users(self):
         """Get all FTP/SSH users"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT f.*, s.domain 
-                FROM ftp_users f
-                LEFT JOIN sites s ON f.site_id = s.id
-                ORDER BY f.created_at DESC
-            ''')
-            return cursor.fetchall()
+        return self._cached_list('ftp_users', '''
+            SELECT f.id, f.site_id, f.username, f.access_type, f.created_at, s.domain
+            FROM ftp_users f
+            LEFT JOIN sites s ON f.site_id = s.id
+            ORDER BY f.created_at DESC
+        ''')
     
     def get_ftp_users_for_site(self, site_id):
         """Get all FTP/SSH users for a site"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM ftp_users WHERE site_id = ?', (site_id,))
-            return cursor.fetchall()
+        with self.read_connection() as conn:
+            return conn.execute('SELECT * FROM ftp_users WHERE site_id = ?', (site_id,)).fetchall()
     
     def delete_ftp_user(self, user_id):
         """Delete a FTP/SSH user record"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM ftp_users WHERE id = ?', (user_id,))
+        self._invalidate_lists()
+    
+    def _load_panel_settings(self):
+        """Return the settings cache, filling it from the database if needed"""
+        settings = self._settings_cache
+        if settings is None:
+            with self._settings_lock:
+                if self._settings_cache is None:
+                    with self.read_connection() as conn:
+                        # (key, value) tuples build the dict directly
+                        cursor = conn.cursor()
+                        cursor.row_factory = None
+                        cursor.execute('SELECT setting_key, setting_value FROM panel_settings')
+                        self._settings_cache = dict(cursor)
+                settings = self._settings_cache
+        return settings
     
     def get_panel_setting(self, key):
         """Get a panel setting value"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT setting_value FROM panel_settings WHERE setting_key = ?', (key,))
-            result = cursor.fetchone()
-            return result['setting_value'] if result else None
+        return self._load_panel_settings().get(key)
     
     def set_panel_setting(self, key, value):
         """Set a panel setting value"""
@@ -302,16 +523,15 @@ class Database:
                 INSERT INTO panel_settings (setting_key, setting_value, updated_at) 
                 VALUES (?, ?, CURRENT_TIMESTAMP)
                 ON CONFLICT(setting_key) 
-                DO UPDATE SET setting_value = ?, updated_at = CURRENT_TIMESTAMP
-            ''', (key, value, value))
+                DO UPDATE SET setting_value = excluded.setting_value, updated_at = CURRENT_TIMESTAMP
+            ''', (key, value))
+        with self._settings_lock:
+            if self._settings_cache is not None:
+                self._settings_cache[key] = value
     
     def get_all_panel_settings(self):
         """Get all panel settings"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT setting_key, setting_value FROM panel_settings')
-            rows = cursor.fetchall()
-            return {row['setting_key']: row['setting_value'] for row in rows}
+        return dict(self._load_panel_settings())
     
     def get_panel_port(self, default_port=8080):
         """Get panel port from settings with fallback to default
@@ -74,17 +74,10 @@ def create_admin_user(db):
     # Create or update user
     password_hash = generate_password_hash(password)
     
+    db.set_user_password(username, password_hash)
     if existing_user:
-        # Update existing user's password
-        with db.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                'UPDATE users SET password_hash = ? WHERE username = ?',
-                (password_hash, username)
-            )
         print(f"[✓] Password updated for user '{username}'")
     else:
-        db.create_user(username, password_hash)
         print(f"[✓] Admin user '{username}' created successfully")
 
 def create_env_file():
@@ -8,8 +8,12 @@ import secrets
 import string
 import re
 import time
+import threading
+import logging
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
 class SiteManager:
     """Manages site creation, deletion, and configuration"""
     
@@ -17,6 +21,10 @@ class SiteManager:
         self.config = config
         self.db = db
         self._init_config_values()
+        
+        # Pending debounced nginx reload, see schedule_nginx_reload()
+        self._reload_lock = threading.Lock()
+        self._reload_timer = None
     
     def _get_config_value(self, key):
         """Helper to get config value from dict or object"""
@@ -155,10 +163,15 @@ class SiteManager:
             except subprocess.CalledProcessError:
                 raise Exception(f"PHP {php_version} FPM service is not running and could not be started. Please check the service status with: systemctl status {service_name}")
     
-    def create_nginx_config(self, domain, php_version, ssl_enabled=False, php_settings=None):
-        """Create Nginx configuration for a site"""
+    def create_nginx_config(self, domain, php_version, ssl_enabled=False, php_settings=None, check_php_fpm=True):
+        """Create Nginx configuration for a site
+        
+        Pass check_php_fpm=False when re-rendering a config whose PHP-FPM
+        service was already verified earlier in the same operation.
+        """
         # Ensure PHP-FPM is running
-        self._ensure_php_fpm_running(php_version)
+        if check_php_fpm:
+            self._ensure_php_fpm_running(php_version)
         
         site_path = os.path.join(self.sites_dir, domain)
         log_path = os.path.join(self.log_dir, domain)
@@ -338,8 +351,43 @@ server {{
         
         return config_path
     
-    def enable_site(self, domain):
-        """Enable a site by creating symlink"""
+    def schedule_nginx_reload(self, delay=0.5):
+        """Reload nginx in the background after a short delay
+        
+        Requests made while a reload is pending restart the delay, so a burst
+        of changes results in a single reload.
+        """
+        with self._reload_lock:
+            if self._reload_timer is not None:
+                self._reload_timer.cancel()
+            self._reload_timer = threading.Timer(delay, self._run_scheduled_reload)
+            self._reload_timer.daemon = True
+            self._reload_timer.start()
+    
+    def _run_scheduled_reload(self):
+        """Perform a reload queued by schedule_nginx_reload()"""
+        with self._reload_lock:
+            self._reload_timer = None
+        # Nobody is waiting on the result anymore, so failures can only be logged
+        try:
+            result = subprocess.run(
+                ['/usr/bin/systemctl', 'reload', 'nginx'],
+                capture_output=True,
+                text=True
+            )
+        except Exception as e:
+            logger.error(f"Scheduled nginx reload failed: {e}")
+            return
+        if result.returncode != 0:
+            logger.error(f"Scheduled nginx reload failed: {result.stderr.strip()}")
+    
+    def enable_site(self, domain, defer_reload=False):
+        """Enable a site by creating symlink
+        
+        The configuration is always tested synchronously. With defer_reload,
+        the reload itself is queued via schedule_nginx_reload(); only use it
+        when nothing later in the request depends on nginx serving the change.
+        """
         available_path = os.path.join(self.nginx_available, domain)
         enabled_path = os.path.join(self.nginx_enabled, domain)
         
@@ -353,9 +401,12 @@ server {{
             raise Exception(f"Nginx config test failed: {result.stderr}")
         
         # Reload nginx
-        subprocess.run(['/usr/bin/systemctl', 'reload', 'nginx'], check=True)
+        if defer_reload:
+            self.schedule_nginx_reload()
+        else:
+            subprocess.run(['/usr/bin/systemctl', 'reload', 'nginx'], check=True)
     
-    def disable_site(self, domain):
+    def disable_site(self, domain, defer_reload=False):
         """Disable a site by removing symlink"""
         enabled_path = os.path.join(self.nginx_enabled, domain)
         
@@ -363,7 +414,10 @@ server {{
             os.unlink(enabled_path)
         
         # Reload nginx
-        subprocess.run(['/usr/bin/systemctl', 'reload', 'nginx'], check=True)
+        if defer_reload:
+            self.schedule_nginx_reload()
+        else:
+            subprocess.run(['/usr/bin/systemctl', 'reload', 'nginx'], check=True)
     
     def delete_site_files(self, domain):
         """Delete all files for a site"""
@@ -467,6 +521,27 @@ server {{
         
         server_name = panel_domain if panel_domain else '_'
         
+        # Anonymous requests for / (mostly uptime probes) are redirected to the
+        # login page by nginx itself; only requests carrying the panel's
+        # session cookie (Flask's default name) reach the panel
+        root_location = f"""location = / {{
+        if ($http_cookie !~* "(^|;\\s*)session=") {{
+            return 302 /login;
+        }}
+        proxy_pass http://127.0.0.1:{panel_port};
+        proxy_set_header Host $host;
+        proxy_set_header X-Real-IP $remote_addr;
+        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+        proxy_set_header X-Forwarded-Proto $scheme;
+    }}"""
+        
+        # File manager downloads are handed back to nginx via X-Accel-Redirect
+        # so large files are sent straight from disk instead of through Python
+        files_location = f"""location /_protected_files/ {{
+        internal;
+        alias {self.sites_dir.rstrip('/')}/;
+    }}"""
+        
         if ssl_enabled and panel_domain:
             # SSL-enabled configuration
             config = f"""# Nginx configuration for Lala Panel
@@ -517,6 +592,13 @@ server {{
     add_header Permissions-Policy "geolocation=(), microphone=(), camera=()" always;
     
     client_max_body_size 100M;
+    # Keep ordinary form posts in memory; larger uploads spill to a temp file
+    # in nginx before the panel sees them
+    client_body_buffer_size 1m;
+    
+    {root_location}
+    
+    {files_location}
     
     location / {{
         proxy_pass http://127.0.0.1:{panel_port};
@@ -524,6 +606,7 @@ server {{
         proxy_set_header X-Real-IP $remote_addr;
         proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
         proxy_set_header X-Forwarded-Proto $scheme;
+        proxy_set_header X-Sendfile-Type X-Accel-Redirect;
     }}
 }}
 """
@@ -544,6 +627,13 @@ server {{
     }}
     
     client_max_body_size 100M;
+    # Keep ordinary form posts in memory; larger uploads spill to a temp file
+    # in nginx before the panel sees them
+    client_body_buffer_size 1m;
+    
+    {root_location}
+    
+    {files_location}
     
     location / {{
         proxy_pass http://127.0.0.1:{panel_port};
@@ -551,6 +641,7 @@ server {{
         proxy_set_header X-Real-IP $remote_addr;
         proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
         proxy_set_header X-Forwarded-Proto $scheme;
+        proxy_set_header X-Sendfile-Type X-Accel-Redirect;
     }}
 }}
 """
@@ -700,6 +791,52 @@ class DatabaseManager:
             
         except Exception as e:
             raise Exception(f"Database deletion failed: {str(e)}")
+    
+    def delete_databases(self, databases):
+        """Delete several MariaDB databases and users over a single connection
+        
+        Args:
+            databases (list): (db_name, db_user) pairs to delete
+            
+        Returns:
+            list: Names of the databases that were dropped; pairs that fail
+            validation or deletion are skipped
+        """
+        import pymysql
+        
+        if not databases:
+            return []
+        
+        try:
+            connection = pymysql.connect(
+                host=self.host,
+                port=self.port,
+                user='root',
+                password=self.root_password
+            )
+        except Exception as e:
+            raise Exception(f"Database deletion failed: {str(e)}")
+        
+        dropped = []
+        try:
+            with connection.cursor() as cursor:
+                for db_name, db_user in databases:
+                    try:
+                        # Validate identifiers to prevent SQL injection
+                        db_name = self._validate_identifier(db_name)
+                        db_user = self._validate_identifier(db_user)
+                        
+                        cursor.execute(f"DROP DATABASE IF EXISTS `{db_name}`")
+                        cursor.execute(f"DROP USER IF EXISTS '{db_user}'@'localhost'")
+                        dropped.append(db_name)
+                    except Exception:
+                        continue
+                
+                cursor.execute("FLUSH PRIVILEGES")
+        finally:
+            connection.close()
+        
+        return dropped
 
 
 class UserManager: